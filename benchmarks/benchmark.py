@@ -0,0 +1,464 @@
+"""
+Benchmark suite of the registered process steps and representative pipelines.
+
+Every class in `process_steps` and every YAML pipeline in `benchmarks/pipelines`
+is run on synthetic stacks across a matrix of frame counts, frame sizes and
+dtypes. Throughput is reported in megapixels (of the input stack) per second,
+memory as the peak of numpy/Python allocations traced during one execution.
+The import time of the package is measured in fresh interpreters. Accuracy
+checks (`check/...` cases) verify documented error bounds, e.g. of the
+quantiles of `AnalyseStatistics` with a `sketch_error`, and fail the run if
+one is exceeded.
+
+Usage:
+  python benchmarks/benchmark.py --preset quick -o results.json
+  python benchmarks/benchmark.py --preset quick --baseline results.json
+
+With `--baseline`, cases slower (or more memory hungry) than the baseline by
+more than the tolerance are flagged and the exit code is 1, so upgrades can be
+gated on the suite. Everything runs offline on the CPU; limit the numerical
+thread pools (e.g. OMP_NUM_THREADS=1) for comparable numbers across machines.
+"""
+import argparse, contextlib, io, json, os, platform, statistics, subprocess, sys, tempfile, time, tracemalloc
+import numpy as np
+import scipy
+import tifffile as tiff
+
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Union
+
+import image_processing_pipeline
+import image_processing_pipeline.processes # Registers the built-in process steps
+from image_processing_pipeline.framework.config import FrameworkConfig
+from image_processing_pipeline.framework.process_pipeline import ProcessPipeline
+from image_processing_pipeline.framework.process_step import process_steps
+
+PIPELINE_DIR = Path(__file__).parent / "pipelines"
+
+# Modules whose import time is measured, the package and what a pipeline run needs
+IMPORT_CASES = ["image_processing_pipeline", "image_processing_pipeline.framework.process_pipeline"]
+
+PRESETS = {
+  "quick": {"frames": [8, 32], "sizes": [128, 512], "dtypes": ["uint8", "uint16", "float32"]},
+  "full": {"frames": [16, 64, 256], "sizes": [256, 1024, 2048], "dtypes": ["uint8", "uint16", "float32"]},
+}
+
+
+class SyntheticData:
+  """
+  Deterministic synthetic stack with disc shaped objects on a noisy background.
+
+  The discs sit on a grid and persist through all frames, so they form one
+  connected object each in 3D. Frame 1 is blank (all zero), as missing frames
+  are in real data, and a sprinkle of dead (zero) pixels is added.
+  """
+  def __init__(self, frames: int, size: int, dtype: str, seed: int = 0):
+    self.frames, self.size, self.dtype = frames, size, np.dtype(dtype)
+    rng = np.random.default_rng(seed)
+
+    cell = max(32, size // 8) # At most 8x8 objects
+    yy, xx = np.mgrid[:size, :size]
+    dy, dx = (yy % cell) - cell // 2, (xx % cell) - cell // 2
+    radius = np.linspace(0.25, 0.35, frames)[:, None, None] * cell
+    self.discs = (dy**2 + dx**2)[None] < radius**2
+    self.n_objects = (size // cell)**2
+
+    unit = 0.2 + 0.1 * xx / size + 0.5 * self.discs + rng.normal(0, 0.05, (frames, size, size))
+    unit = np.clip(unit, 0.01, 1.).astype(np.float32)
+    unit[rng.random(unit.shape) < 1e-3] = 0
+    if frames > 2:
+      unit[1] = 0
+    self.unit = unit # Float stack in [0, 1]
+
+    if self.dtype.kind in "ui":
+      self.stack = np.round(unit * np.iinfo(self.dtype).max).astype(self.dtype)
+    else:
+      self.stack = unit.astype(self.dtype)
+    self.mask = self.discs.astype(np.uint8)
+    self.mask_frames = self.mask[::max(1, frames // 4)]
+    self._path = None
+
+  @property
+  def megapixels(self) -> float:
+    return self.frames * self.size**2 / 1e6
+
+  def path(self, directory: Path) -> Path:
+    """The stack written to a multipage tiff in `directory`."""
+    if self._path is None:
+      self._path = directory / f"synthetic_{self.frames}x{self.size}_{self.dtype}.tif"
+      tiff.imwrite(self._path, self.stack)
+    return self._path
+
+
+@dataclass
+class StepCase:
+  """Arguments of one step execution: inputs, options and deliverable names."""
+  inputs: dict
+  options: dict
+  deliverables: list
+
+
+CROP = {"top": 2, "bottom": 2, "left": 2, "right": 2}
+
+STEP_CASES: dict[str, Callable[[SyntheticData, Path], StepCase]] = {
+  "ApplyMask": lambda d, _: StepCase(
+    {"input_stack": d.stack, "mask_stack": d.mask_frames}, {}, ["masked_stack"]),
+  "ApplyMorphologies": lambda d, _: StepCase(
+    {"input_stack": d.mask}, {"strategy": {"binary_opening": {"iterations": 1}, "binary_dilation": {"iterations": 1}}},
+    ["morphed_stack"]),
+  "AnalyseStatistics": lambda d, _: StepCase(
+    {"input_stack": d.stack, "mask_stack": d.mask_frames}, {},
+    ["mean", "std", "q5", "q50", "q95", "weight", "mode"]),
+  "ArithmeticStackOperation": lambda d, _: StepCase(
+    {"stack_a": d.stack, "stack_b": d.stack}, {"operation": "multiply"}, ["result_stack"]),
+  "CombineOffsets": lambda d, _: StepCase(
+    {"offset_1": (2, 3), "offset_2": (4, 5)}, {}, ["combined_offset"]),
+  "CullBoundary": lambda d, _: StepCase(
+    {"input_stack": d.stack}, dict(CROP), ["culled_stack", "former_image_shape", "culled_image_offset"]),
+  "ExtractDimensions": lambda d, _: StepCase(
+    {"input_stack": d.stack}, {}, ["depth", "width", "height"]),
+  "ExtractFrames": lambda d, _: StepCase(
+    {"input_stack": d.stack}, {"frames": list(range(0, d.frames, 2))}, ["extracted_frames"]),
+  "ExtractObjects": lambda d, _: StepCase(
+    {"input_stack": d.mask}, {},
+    [f"{kind}_{n}" for n in range(d.n_objects) for kind in ("object_stack", "offset")]),
+  "Extrapolate": lambda d, _: StepCase(
+    {"input_stack": d.stack}, {}, ["extrapolated_stack", "extrapolated_frames"]),
+  "FourierDenoise": lambda d, _: StepCase(
+    {"input_stack": d.unit}, {"denoise_level": 0.1}, ["denoised_stack"]),
+  "GenerateEdgeMask": lambda d, _: StepCase(
+    {"input_stack": d.stack}, {"sigma": 2.}, ["edge_mask"]),
+  "GeometryFilterMasks": lambda d, _: StepCase(
+    {"input_stack": d.mask}, {"min_area": 16., "min_aspect_dx_dy": 0.5}, ["filtered_mask_stack"]),
+  "Interpolate": lambda d, _: StepCase(
+    {"input_stack": d.stack}, {"mode": "interpolate"}, ["interpolated_stack", "interpolated_frames"]),
+  "Invert": lambda d, _: StepCase(
+    {"input_stack": d.unit}, {}, ["inverted_stack"]),
+  "LabelRegions": lambda d, _: StepCase(
+    {"input_stack": d.mask}, {}, ["labelled_stack", "region_table"]),
+  "LoadStack": lambda d, p: StepCase(
+    {"input_path": d.path(p)}, dict(CROP), ["loaded_stack", "former_image_shape", "culled_image_offset"]),
+  "MedianFilter": lambda d, _: StepCase(
+    {"input_stack": d.stack}, {"iterations": 1, "size": 3}, ["filtered_stack"]),
+  "Normalise": lambda d, _: StepCase(
+    {"input_stack": d.stack}, {}, ["normalised_stack"]),
+  "NumberAdder": lambda d, _: StepCase(
+    {"number_1": 1, "number_2": 2.5}, {}, ["sum"]),
+  "RemoveOutliers": lambda d, _: StepCase(
+    {"input_stack": d.stack}, {"lower_quantile": 0.01, "upper_quantile": 0.99}, ["filtered_stack"]),
+  "RemoveZeroPixels": lambda d, _: StepCase(
+    {"input_stack": d.stack}, {}, ["corrected_stack"]),
+  "ShrinkToContent": lambda d, _: StepCase(
+    {"input_stack": d.mask}, {}, ["output_stack", "offset"]),
+  "StarFill": lambda d, _: StepCase(
+    {"input_mask": d.mask}, {}, ["output_mask"]),
+  "ThresholdBinarise": lambda d, _: StepCase(
+    {"input_stack": d.unit}, {"threshold": 0.5}, ["binary_stack"]),
+}
+
+
+# Relative errors and quantiles (in percent) of the accuracy checks of AnalyseStatistics' `sketch_error`
+SKETCH_ERRORS = [0.01, 0.05]
+SKETCH_QUANTILES = [0, 1, 5, 25, 50, 75, 95, 99, 100]
+
+
+@dataclass
+class CaseResult:
+  case: str
+  megapixels: float
+  times: list
+  peak_bytes: Union[int, None] = None
+  error: Union[str, None] = None
+
+  @property
+  def median(self) -> float:
+    return statistics.median(self.times) if self.times else float("nan")
+
+  @property
+  def megapixels_per_second(self) -> float:
+    return self.megapixels / self.median if self.times and self.median > 0 else float("nan")
+
+  def to_dict(self) -> dict:
+    entry = asdict(self)
+    entry["median"] = self.median
+    entry["megapixels_per_second"] = self.megapixels_per_second
+    return entry
+
+
+def _measure(run: Callable[[], None], setup: Callable[[], None], repeat: int) -> tuple[list, int]:
+  """Time `run` `repeat` times, then trace its peak allocations in one extra execution."""
+  times = []
+  for _ in range(repeat):
+    setup()
+    start = time.perf_counter()
+    run()
+    times.append(time.perf_counter() - start)
+
+  setup()
+  tracemalloc.start()
+  try:
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+  finally:
+    tracemalloc.stop()
+  return times, peak
+
+
+def bench_step(name: str, data: SyntheticData, directory: Path, repeat: int,
+               float_dtype: Union[str, None] = None) -> CaseResult:
+  case_id = f"step/{name}/{data.dtype}/{data.frames}x{data.size}x{data.size}"
+  if name not in STEP_CASES:
+    return CaseResult(case_id, data.megapixels, [], error="No benchmark case defined for this step")
+  process_class = process_steps[name]
+  kwargs = {}
+
+  def setup():
+    case = STEP_CASES[name](data, directory)
+    inputs = {
+      k: (v.copy() if k in process_class.mutated_inputs else v) for k, v in case.inputs.items()
+    } # The pipeline hands out copies of mutated inputs only
+    kwargs.update(
+      inputs=inputs, options=case.options, delivers_id_map={d: d for d in case.deliverables}, float_dtype=float_dtype
+    )
+
+  def run():
+    process_class(**kwargs).execute()
+
+  try:
+    times, peak = _measure(run, setup, repeat)
+  except Exception as e:
+    return CaseResult(case_id, data.megapixels, [], error=f"{type(e).__name__}: {e}")
+  return CaseResult(case_id, data.megapixels, times, peak)
+
+
+def bench_pipeline(config_path: Path, data: SyntheticData, directory: Path, repeat: int,
+                   float_dtype: Union[str, None] = None) -> CaseResult:
+  case_id = f"pipeline/{config_path.stem}/{data.dtype}/{data.frames}x{data.size}x{data.size}"
+  output_dir = directory / "output" / config_path.stem
+
+  def run():
+    with contextlib.redirect_stdout(io.StringIO()):
+      ProcessPipeline(
+        config_path=config_path, output_dir=output_dir, inputs={"input_path": data.path(directory)},
+        framework_config=FrameworkConfig(float_dtype=float_dtype),
+      ).run()
+
+  try:
+    times, peak = _measure(run, lambda: None, repeat)
+  except Exception as e:
+    return CaseResult(case_id, data.megapixels, [], error=f"{type(e).__name__}: {e}")
+  return CaseResult(case_id, data.megapixels, times, peak)
+
+
+def check_sketch(sketch_error: float, data: SyntheticData, directory: Path, repeat: int,
+                 float_dtype: Union[str, None] = None) -> CaseResult:
+  """
+  Accuracy check of AnalyseStatistics with a `sketch_error`, per frame and pooled.
+
+  Every sketched quantile must lie within the relative error `sketch_error` of
+  the exact one, `np.quantile` of the masked pixels weighted by the (interpolated)
+  mask, as documented by `QuantileSketch`. A violation is reported as the error
+  of the case, failing the run.
+  """
+  case_id = f"check/sketch_error={sketch_error}/{data.dtype}/{data.frames}x{data.size}x{data.size}"
+  process_class = process_steps["AnalyseStatistics"]
+  deliverables = ["mean", "std", "weight", "mode"] + [f"q{q}" for q in SKETCH_QUANTILES]
+
+  def execute(pooled: bool):
+    process = process_class(
+      inputs={"input_stack": data.stack, "mask_stack": data.mask_frames},
+      options={"sketch_error": sketch_error, "pooled": pooled},
+      delivers_id_map={d: d for d in deliverables}, float_dtype=float_dtype,
+    )
+    return process, process.execute()
+
+  try:
+    times, peak = _measure(lambda: execute(False), lambda: None, repeat)
+    (process, per_frame), (_, pooled) = execute(False), execute(True)
+    # Exact quantiles, with the masks the step applied to every frame
+    masks = np.stack([process._get_mask_at_frame(i) for i in range(data.frames)])
+    samples, weights = data.stack.astype(np.float64), masks.astype(np.float64)
+    expected = [(per_frame, i, samples[i].ravel(), weights[i].ravel()) for i in range(data.frames)]
+    expected.append((pooled, 0, samples.ravel(), weights.ravel()))
+    worst = 0.
+    for results, i, values, w in expected:
+      exact = np.quantile(values, np.array(SKETCH_QUANTILES) / 100, weights=w, method="inverted_cdf")
+      for q, x in zip(SKETCH_QUANTILES, exact):
+        deviation = abs(results[f"q{q}"][i] - x)
+        if deviation > sketch_error * abs(x) * (1 + 1e-9): # Allow for float rounding only
+          raise AssertionError(
+            f"q{q} of {'all frames' if results is pooled else f'frame {i}'} is {results[f'q{q}'][i]}, "
+            f"exact {x}, beyond the relative error {sketch_error}"
+          )
+        worst = max(worst, deviation / abs(x) if x else 0.)
+    print(f"{case_id:<60} worst relative error {worst:.2e}", flush=True)
+  except Exception as e:
+    return CaseResult(case_id, data.megapixels, [], error=f"{type(e).__name__}: {e}")
+  return CaseResult(case_id, data.megapixels, times, peak)
+
+
+def bench_import(module: str, repeat: int) -> CaseResult:
+  """Time importing `module` in fresh interpreters, then trace its peak allocations in one more."""
+  case_id = f"import/{module}"
+  script = (
+    "import json, sys, time, tracemalloc\n"
+    "trace = sys.argv[1] == 'trace'\n"
+    "if trace: tracemalloc.start()\n"
+    "start = time.perf_counter()\n"
+    f"import {module}\n"
+    "elapsed = time.perf_counter() - start\n"
+    "print(json.dumps({'time': elapsed, 'peak': tracemalloc.get_traced_memory()[1] if trace else None}))\n"
+  )
+  env = {**os.environ, "PYTHONPATH": os.pathsep.join(p for p in sys.path if p)} # Import the same package
+
+  def measure(trace: bool) -> dict:
+    completed = subprocess.run(
+      [sys.executable, "-c", script, "trace" if trace else "time"], env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(completed.stdout.splitlines()[-1])
+
+  try:
+    times = [measure(False)["time"] for _ in range(repeat)]
+    peak = measure(True)["peak"]
+  except subprocess.CalledProcessError as e:
+    return CaseResult(case_id, 0., [], error=e.stderr.strip().splitlines()[-1])
+  return CaseResult(case_id, 0., times, peak)
+
+
+def environment() -> dict:
+  return {
+    "package_version": image_processing_pipeline.__version__,
+    "python": platform.python_version(),
+    "numpy": np.__version__,
+    "scipy": scipy.__version__,
+    "tifffile": tiff.__version__,
+    "machine": platform.machine(),
+    "processor": platform.processor(),
+    "system": platform.platform(),
+  }
+
+
+def run_suite(frames: list[int], sizes: list[int], dtypes: list[str], repeat: int = 3,
+              pattern: str = "", pipelines: bool = True, float_dtype: Union[str, None] = None) -> list[CaseResult]:
+  """
+  Run all step (and pipeline) cases whose id contains `pattern` over the size
+  matrix, with the precision policy `float_dtype` (see `FrameworkConfig`).
+  """
+  results = []
+  for module in IMPORT_CASES:
+    if pattern in f"import/{module}":
+      results.append(bench_import(module, repeat))
+      print(_format_result(results[-1]), flush=True)
+  configs = sorted(PIPELINE_DIR.glob("*.yaml")) if pipelines else []
+  with tempfile.TemporaryDirectory() as tmp:
+    for dtype in dtypes:
+      for n_frames in frames:
+        for size in sizes:
+          data = SyntheticData(n_frames, size, dtype)
+          tags = f"/{dtype}/{n_frames}x{size}x{size}"
+          jobs = [(f"step/{name}{tags}", bench_step, name) for name in sorted(process_steps)]
+          jobs += [(f"pipeline/{path.stem}{tags}", bench_pipeline, path) for path in configs]
+          jobs += [(f"check/sketch_error={error}{tags}", check_sketch, error) for error in SKETCH_ERRORS]
+          for case_id, bench, target in jobs:
+            if pattern not in case_id:
+              continue
+            result = bench(target, data, Path(tmp), repeat, float_dtype)
+            results.append(result)
+            print(_format_result(result), flush=True)
+  return results
+
+
+def _format_result(result: CaseResult) -> str:
+  if result.error is not None:
+    return f"{result.case:<60} ERROR {result.error}"
+  throughput = f"{result.megapixels_per_second:>10.1f} MP/s" if result.megapixels else " " * 15
+  return (
+    f"{result.case:<60}{result.median * 1e3:>10.2f} ms{throughput}"
+    f"{result.peak_bytes / 1e6:>10.1f} MB"
+  )
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.25,
+            memory_tolerance: float = 0.25, min_time: float = 1e-3) -> list[str]:
+  """
+  Regressions of `results` against `baseline` (both as written by `main`).
+
+  A case regresses if its median time grows by more than `tolerance` (relative)
+  and by more than `min_time` seconds, filtering out noise of very fast cases, if
+  its peak memory grows by more than `memory_tolerance`, or if it fails while it
+  succeeded in the baseline.
+  """
+  regressions = []
+  for case, base in baseline["cases"].items():
+    current = results["cases"].get(case)
+    if current is None or base["error"] is not None:
+      continue
+    if current["error"] is not None:
+      regressions.append(f"{case}: fails with {current['error']}")
+      continue
+    if current["median"] > base["median"] * (1 + tolerance) and current["median"] - base["median"] > min_time:
+      regressions.append(
+        f"{case}: {base['median'] * 1e3:.2f} ms -> {current['median'] * 1e3:.2f} ms "
+        f"({current['median'] / base['median']:.2f}x)"
+      )
+    if base["peak_bytes"] and current["peak_bytes"] > base["peak_bytes"] * (1 + memory_tolerance):
+      regressions.append(
+        f"{case}: peak memory {base['peak_bytes'] / 1e6:.1f} MB -> {current['peak_bytes'] / 1e6:.1f} MB"
+      )
+  return regressions
+
+
+def _int_list(value: str) -> list[int]:
+  return [int(v) for v in value.split(",")]
+
+
+def main(argv: Union[list, None] = None) -> int:
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument("--preset", choices=sorted(PRESETS), default="quick", help="Size matrix to run.")
+  parser.add_argument("--frames", type=_int_list, help="Comma separated frame counts, overriding the preset.")
+  parser.add_argument("--sizes", type=_int_list, help="Comma separated frame sizes, overriding the preset.")
+  parser.add_argument("--dtypes", type=lambda v: v.split(","), help="Comma separated dtypes, overriding the preset.")
+  parser.add_argument("-k", "--filter", default="", help="Only run cases whose id contains this string.")
+  parser.add_argument("-r", "--repeat", type=int, default=3, help="Timed repetitions per case.")
+  parser.add_argument("--no-pipelines", action="store_true", help="Skip the end-to-end pipelines.")
+  parser.add_argument("--float-dtype", help="Precision policy of steps and pipelines, e.g. float32.")
+  parser.add_argument("-o", "--output", type=Path, help="JSON file receiving the results.")
+  parser.add_argument("--baseline", type=Path, help="Results JSON to compare against.")
+  parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown.")
+  parser.add_argument("--memory-tolerance", type=float, default=0.25, help="Allowed relative peak memory growth.")
+  args = parser.parse_args(argv)
+
+  preset = PRESETS[args.preset]
+  results = run_suite(
+    args.frames or preset["frames"], args.sizes or preset["sizes"], args.dtypes or preset["dtypes"],
+    repeat=args.repeat, pattern=args.filter, pipelines=not args.no_pipelines, float_dtype=args.float_dtype,
+  )
+  report = {
+    "environment": environment(), "float_dtype": args.float_dtype, "cases": {r.case: r.to_dict() for r in results}
+  }
+  if args.output is not None:
+    with open(args.output, "w") as f:
+      json.dump(report, f, indent=2)
+
+  failed_checks = [r for r in results if r.case.startswith("check/") and r.error is not None]
+  if failed_checks:
+    print(f"\n{len(failed_checks)} failed accuracy check(s):")
+    print("\n".join(f"  {r.case}: {r.error}" for r in failed_checks))
+    return 1
+
+  if args.baseline is None:
+    return 0
+  with open(args.baseline) as f:
+    baseline = json.load(f)
+  regressions = compare(report, baseline, args.tolerance, args.memory_tolerance)
+  if regressions:
+    print(f"\n{len(regressions)} regression(s) against {args.baseline}:")
+    print("\n".join(f"  {r}" for r in regressions))
+    return 1
+  print(f"\nNo regressions against {args.baseline}.")
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
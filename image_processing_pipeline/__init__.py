@@ -1,9 +1,16 @@
 from importlib.metadata import PackageNotFoundError, version
 
 from image_processing_pipeline.framework.process_pipeline import ProcessPipeline
-from image_processing_pipeline.framework.visualiser import Visualiser
 
 try:
-  __version__ = version("image_process_pipeline")
+  __version__ = version("image_processing_pipeline")
 except PackageNotFoundError:
-  __version__ = "unknown"
\ No newline at end of file
+  __version__ = "unknown"
+
+
+def __getattr__(name: str):
+  # Visualiser imports matplotlib, which is slow to import and not needed to run pipelines
+  if name == "Visualiser":
+    from image_processing_pipeline.framework.visualiser import Visualiser
+    return Visualiser
+  raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,238 @@
+import argparse, contextlib, glob, multiprocessing, os, sys, tempfile, time, traceback
+import yaml
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Union
+
+from image_processing_pipeline.framework.config import FrameworkConfig
+from image_processing_pipeline.framework.process_pipeline import ProcessPipeline
+
+# Environment variables limiting the thread pools of numerical libraries
+THREAD_LIMIT_VARIABLES = [
+  "OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+  "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS",
+]
+
+
+@dataclass
+class BatchResult:
+  input_path: Path
+  output_dir: Path
+  succeeded: bool
+  wall_time: float
+  input_bytes: int
+  error: Union[str, None] = None
+
+
+@dataclass
+class BatchSummary:
+  results: list[BatchResult] = field(default_factory=list)
+  wall_time: float = 0.
+
+  @property
+  def succeeded(self) -> list[BatchResult]:
+    return [r for r in self.results if r.succeeded]
+
+  @property
+  def failed(self) -> list[BatchResult]:
+    return [r for r in self.results if not r.succeeded]
+
+  @property
+  def datasets_per_second(self) -> float:
+    return len(self.succeeded) / self.wall_time if self.wall_time > 0 else 0.
+
+  @property
+  def megabytes_per_second(self) -> float:
+    processed = sum(r.input_bytes for r in self.succeeded)
+    return processed / 1e6 / self.wall_time if self.wall_time > 0 else 0.
+
+  def __str__(self) -> str:
+    lines = [
+      f"Processed {len(self.succeeded)}/{len(self.results)} datasets in {self.wall_time:.1f} s "
+      f"({self.datasets_per_second:.2f} datasets/s, {self.megabytes_per_second:.1f} MB/s input)"
+    ]
+    for r in self.failed:
+      lines.append(f"  FAILED {r.input_path}: {r.error}")
+    return "\n".join(lines)
+
+
+def expand_inputs(inputs: Union[str, Path, list]) -> list[Path]:
+  """Expand a path, glob pattern or list of them into a sorted list of files, keeping the given order of lists."""
+  if isinstance(inputs, (str, Path)):
+    inputs = [inputs]
+  paths = []
+  for entry in inputs:
+    if glob.has_magic(str(entry)):
+      matches = sorted(glob.glob(str(entry), recursive=True))
+      if not matches:
+        raise FileNotFoundError(f"No input files match '{entry}'.")
+      paths.extend(Path(m) for m in matches)
+    else:
+      paths.append(Path(entry))
+  return paths
+
+
+def _dataset_output_dirs(input_paths: list[Path], output_dir: Path) -> list[Path]:
+  """
+  One output directory per input, named after the file stem. Clashing names get
+  the first free suffix `_2`, `_3`, ..., checked against all names used, also
+  those of inputs named like a suffixed stem (and case-insensitively, for such file systems).
+  """
+  dirs, used = [], set()
+  for path in input_paths:
+    name, n = path.stem, 1
+    while name.casefold() in used:
+      n += 1
+      name = f"{path.stem}_{n}"
+    used.add(name.casefold())
+    dirs.append(output_dir / name)
+  return dirs
+
+
+def _run_dataset(config_path: Path, config: dict, input_id: str, input_path: Path,
+                 output_dir: Path, pipeline_kwargs: dict) -> BatchResult:
+  """Run the pipeline on one dataset, logging its output to `output_dir`. Never raises."""
+  start = time.perf_counter()
+  input_bytes = input_path.stat().st_size if input_path.is_file() else 0
+  output_dir.mkdir(parents=True, exist_ok=True)
+  with open(output_dir / "pipeline.log", "w") as log, contextlib.redirect_stdout(log):
+    try:
+      pipeline = ProcessPipeline(
+        config_path=config_path, output_dir=output_dir, inputs={input_id: input_path},
+        config=config, **pipeline_kwargs
+      )
+      pipeline.run()
+    except Exception as e:
+      traceback.print_exc(file=log)
+      return BatchResult(input_path, output_dir, False, time.perf_counter() - start, input_bytes,
+                         f"{type(e).__name__}: {e}")
+  return BatchResult(input_path, output_dir, True, time.perf_counter() - start, input_bytes)
+
+
+@contextlib.contextmanager
+def _thread_limits(threads_per_worker: Union[int, None]):
+  """Limit numerical thread pools of worker processes, which inherit the environment on start."""
+  if threads_per_worker is None:
+    yield
+    return
+  backup = {var: os.environ.get(var) for var in THREAD_LIMIT_VARIABLES}
+  os.environ.update({var: str(threads_per_worker) for var in THREAD_LIMIT_VARIABLES})
+  try:
+    yield
+  finally:
+    for var, value in backup.items():
+      if value is None:
+        os.environ.pop(var, None)
+      else:
+        os.environ[var] = value
+
+
+def run_batch(config_path: Union[str, Path],
+              inputs: Union[str, Path, list],
+              output_dir: Union[str, Path],
+              input_id: Union[str, None] = None,
+              max_workers: Union[int, None] = None,
+              threads_per_worker: Union[int, None] = 1,
+              framework_config: Union[FrameworkConfig, None] = None,
+              data_manager_type: str = "native",
+              data_manager_options: Union[dict, None] = None) -> BatchSummary:
+  """
+  Apply one pipeline config to many input files, using a process pool.
+
+  The config is parsed and validated once, against the first input, before any
+  dataset is processed. Each dataset writes to its own directory in `output_dir`,
+  including a `pipeline.log` with the pipeline output. A failing dataset is
+  recorded in the summary and does not affect the others.
+
+  `inputs` are paths or glob patterns. `input_id` names the config input the
+  file path is registered as, and defaults to the only entry of the config's
+  `Inputs`. `threads_per_worker` limits the thread pools of numerical libraries
+  in each worker process.
+  """
+  config_path, output_dir = Path(config_path), Path(output_dir)
+  input_paths = expand_inputs(inputs)
+  if not input_paths:
+    raise ValueError("No inputs given.")
+
+  with open(config_path, "r", encoding="utf-8") as f:
+    config = yaml.safe_load(f)
+  if input_id is None:
+    declared = config.get("Inputs", [])
+    if len(declared) != 1:
+      raise ValueError(
+        f"Config declares inputs {declared}, cannot choose the batch input. Specify 'input_id'."
+      )
+    input_id = declared[0]
+
+  pipeline_kwargs = {
+    "data_manager_type": data_manager_type,
+    "data_manager_options": data_manager_options or {},
+    "framework_config": framework_config or FrameworkConfig(),
+  }
+  output_dirs = _dataset_output_dirs(input_paths, output_dir)
+
+  # Validate once, so config errors surface before any work is distributed,
+  # in a scratch directory, as building the pipeline creates its output directory
+  with tempfile.TemporaryDirectory() as scratch:
+    ProcessPipeline(
+      config_path=config_path, output_dir=Path(scratch), inputs={input_id: input_paths[0]},
+      config=config, **pipeline_kwargs
+    )
+
+  summary = BatchSummary()
+  start = time.perf_counter()
+  context = multiprocessing.get_context("spawn")
+  with _thread_limits(threads_per_worker), \
+       ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+    futures = {
+      pool.submit(_run_dataset, config_path, config, input_id, path, out, pipeline_kwargs): n \
+        for n, (path, out) in enumerate(zip(input_paths, output_dirs))
+    }
+    results = {}
+    for future in as_completed(futures):
+      n = futures[future]
+      try:
+        result = future.result()
+      except BrokenProcessPool as e: # A worker died, e.g. killed by the OOM killer
+        result = BatchResult(input_paths[n], output_dirs[n], False, 0., 0, f"Worker process terminated: {e}")
+      results[n] = result
+      status = "done" if result.succeeded else "FAILED"
+      print(f"[{len(results)}/{len(futures)}] {status}: {result.input_path} ({result.wall_time:.1f} s)")
+  summary.wall_time = time.perf_counter() - start
+
+  # In the order of the inputs, which may repeat a path
+  summary.results = [results[n] for n in sorted(results)]
+  return summary
+
+
+def main(argv: Union[list, None] = None) -> int:
+  parser = argparse.ArgumentParser(
+    description="Apply an image processing pipeline config to many input files."
+  )
+  parser.add_argument("config", type=Path, help="Pipeline YAML config.")
+  parser.add_argument("inputs", nargs="+", help="Input files or glob patterns.")
+  parser.add_argument("-o", "--output-dir", type=Path, required=True,
+                      help="Directory receiving one sub directory per input.")
+  parser.add_argument("-j", "--workers", type=int, default=None,
+                      help="Number of worker processes. Defaults to the CPU count.")
+  parser.add_argument("--threads-per-worker", type=int, default=1,
+                      help="Thread limit of numerical libraries per worker.")
+  parser.add_argument("--input-id", default=None,
+                      help="Config input the file path is registered as.")
+  parser.add_argument("--data-manager", default="native", help="Data manager type.")
+  args = parser.parse_args(argv)
+
+  summary = run_batch(
+    args.config, args.inputs, args.output_dir, input_id=args.input_id,
+    max_workers=args.workers, threads_per_worker=args.threads_per_worker,
+    data_manager_type=args.data_manager,
+  )
+  print(summary)
+  return 0 if not summary.failed else 1
+
+
+if __name__ == "__main__":
+  sys.exit(main())
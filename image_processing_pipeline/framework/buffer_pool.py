@@ -0,0 +1,92 @@
+import threading, weakref
+import numpy as np
+
+from collections import OrderedDict
+from typing import Iterable, Union
+
+
+class BufferPool:
+  """
+  Arrays no longer in use, kept to serve as outputs of later steps.
+
+  Steps take uninitialised arrays with `acquire` (see `AbstractProcessStep._empty`)
+  instead of allocating them. The pipeline hands arrays back with `release`
+  once their data is released. Only arrays created by `acquire` are taken back,
+  and only while they share no memory with the `live` data passed along, so
+  views of them handed on as other data are never overwritten.
+
+  Free arrays are kept up to `max_bytes`, dropping the least recently released
+  ones first. None keeps all of them.
+  """
+
+  def __init__(self, max_bytes: Union[int, None] = None):
+    if max_bytes is not None and max_bytes < 0:
+      raise ValueError(f"max_bytes must be non-negative, got {max_bytes}.")
+    self.max_bytes = max_bytes
+    self.allocations = 0
+    self.allocated_bytes = 0
+    self.reuses = 0
+    self.reused_bytes = 0
+
+    self._free = OrderedDict() # id -> array, least recently released first
+    self._free_bytes = 0
+    self._issued = weakref.WeakValueDictionary() # id -> array, for every array created
+    self._lock = threading.Lock()
+
+  def acquire(self, shape: tuple, dtype) -> np.ndarray:
+    """An uninitialised C-contiguous array of `shape` and `dtype`, reused if possible."""
+    shape, dtype = tuple(shape), np.dtype(dtype)
+    with self._lock:
+      for key, array in self._free.items():
+        if array.shape == shape and array.dtype == dtype:
+          del self._free[key]
+          self._free_bytes -= array.nbytes
+          self.reuses += 1
+          self.reused_bytes += array.nbytes
+          return array
+      array = np.empty(shape, dtype)
+      if array.nbytes > 0:
+        self._issued[id(array)] = array
+      self.allocations += 1
+      self.allocated_bytes += array.nbytes
+      return array
+
+  def release(self, array, live: Iterable = ()) -> bool:
+    """
+    Take back `array` for reuse, unless it was not created by `acquire` or
+    shares memory with any array in `live`. Returns whether it was taken back.
+    """
+    if not isinstance(array, np.ndarray):
+      return False
+    with self._lock:
+      if self._issued.get(id(array)) is not array or id(array) in self._free:
+        return False
+      if self.max_bytes is not None and array.nbytes > self.max_bytes:
+        return False
+      for other in live:
+        if isinstance(other, np.ndarray) and other is not array and np.may_share_memory(array, other):
+          return False
+      array.flags.writeable = True
+      self._free[id(array)] = array
+      self._free_bytes += array.nbytes
+      while self.max_bytes is not None and self._free_bytes > self.max_bytes:
+        _, dropped = self._free.popitem(last=False)
+        self._free_bytes -= dropped.nbytes
+      return True
+
+  @property
+  def free_bytes(self) -> int:
+    """Bytes of the arrays currently kept for reuse."""
+    return self._free_bytes
+
+  def clear(self):
+    """Drop all arrays kept for reuse."""
+    with self._lock:
+      self._free.clear()
+      self._free_bytes = 0
+
+  def statistics(self) -> dict:
+    return {
+      "allocations": self.allocations, "allocated_bytes": self.allocated_bytes,
+      "reuses": self.reuses, "reused_bytes": self.reused_bytes,
+    }
@@ -1,7 +1,35 @@
 from dataclasses import dataclass, field
+from typing import Union
+
+DEFAULT_EXECUTION_SETTINGS = {
+  "counter_width": None,
+  "release_intermediates": True, # Drop data from the data manager after its last use
+  "buffer_pool_bytes": 1024**3, # Bytes of released arrays kept to serve as step outputs, 0 disables reuse, None for unbounded
+  "scheduler": "sequential", # "sequential" or "threaded", running independent steps concurrently
+  "max_workers": None, # Thread count of the threaded scheduler, None for the executor default
+  "memory_ceiling": None, # Bytes held by the data manager above which no further step is started
+  "cache_dir": None, # Directory of the persistent step result cache, None disables caching
+  "cache_max_bytes": 10 * 1000**3, # Size bound of the step cache, None for unbounded
+  "checkpoint_path": None, # HDF5 file the data is checkpointed to after every step, see `ProcessPipeline.resume`
+  "stream_chunk_frames": None, # Frames per chunk when streaming runs of frame-local steps, None disables streaming
+  "fuse_block_bytes": 2 * 1024**2, # Bytes per array of the blocks fused runs of frame-local steps are executed on, None disables fusion
+  "serialisation_workers": None, # Threads writing results during the run, None for the executor default, 0 to write them after the run
+  "results_container": None, # HDF5 file in the output directory receiving all results, see `ResultContainer`, None writes a file per result
+  "report_path": None, # JSON file receiving the performance report of a run
+  "trace_path": None, # Chrome trace-event file receiving the performance report of a run
+}
 
 @dataclass
 class FrameworkConfig:
   # Framework settings
   pedantic_input_checking: bool = True
-  execution_settings: dict = field(default_factory=lambda: {"counter_width": None})
\ No newline at end of file
+  pedantic_value_checks: bool = False # Let steps scan their inputs to validate values, instead of trusting known value ranges
+  float_dtype: Union[str, None] = None # Dtype of float results of all steps, e.g. "float32", None for each step's own choice
+  # Settings of a run, missing keys take their value from `DEFAULT_EXECUTION_SETTINGS`
+  execution_settings: dict = field(default_factory=lambda: dict(DEFAULT_EXECUTION_SETTINGS))
+  # Hooks called before and after every step, see `instrumentation.StepHook`
+  step_hooks: list = field(default_factory=list)
+
+  def settings(self) -> dict:
+    """The execution settings, completed by the defaults of keys not given."""
+    return {**DEFAULT_EXECUTION_SETTINGS, **self.execution_settings}
@@ -1,26 +1,96 @@
-import copy
+import copy, math, tempfile, threading, weakref
+import numpy as np
 
-from typing import Union
+from collections import OrderedDict
+from pathlib import Path
+from typing import TYPE_CHECKING, Union
+
+from image_processing_pipeline.framework.value_range import ValueRange
+
+if TYPE_CHECKING:
+  import h5py
+  from image_processing_pipeline.framework.buffer_pool import BufferPool
 
 data_managers = {}
 
 class DataManager:
   def __init__(self):
     self._results = {}
+    self._value_ranges = {} # id -> ValueRange, for data whose value range is known
+    # Pool providing new arrays and taking back removed ones, set by the pipeline for a run
+    self.buffer_pool: Union["BufferPool", None] = None
+    # Guards the data, steps of the threaded scheduler register and remove it concurrently
+    self._lock = threading.RLock()
   
   def add(self, id, data):
-    self._results[id] = data
+    self._store(id, data)
   
   def contains(self, id):
     return id in self._results
   
-  def get(self, id):
+  def get(self, id, writable: bool = False):
+    """
+    Retrieve the data registered under `id`.
+
+    Arrays are handed out as read-only views, so no copy is made unless a
+    `writable` private copy is requested. All other data is deep copied.
+    """
     if not self.contains(id):
       raise KeyError(f"Data with id {id} not found.")
-    return copy.deepcopy(self._results[id])
+    return self._read(self._results[id], writable)
+
+  def _read(self, data, writable: bool):
+    if isinstance(data, np.ndarray):
+      if writable:
+        copied = self._empty(data.shape, data.dtype)
+        np.copyto(copied, data)
+        return copied
+      view = data.view()
+      view.flags.writeable = False
+      return view
+    return copy.deepcopy(data)
   
   def registered_results(self):
-    return list(self._results.keys())
+    with self._lock:
+      return list(self._results.keys())
+
+  @property
+  def memory_usage(self) -> int:
+    """Bytes of array data currently held in RAM."""
+    with self._lock:
+      return sum(data.nbytes for data in self._results.values() if isinstance(data, np.ndarray))
+
+  def remove(self, id) -> int:
+    """Drop the data registered under `id`. Returns the number of array bytes released."""
+    with self._lock:
+      if not self.contains(id):
+        raise KeyError(f"Data with id {id} not found.")
+      data = self._results.pop(id)
+      self._value_ranges.pop(id, None)
+      self._recycle(data)
+      return data.nbytes if isinstance(data, np.ndarray) else 0
+
+  def _empty(self, shape: tuple, dtype) -> np.ndarray:
+    if self.buffer_pool is not None:
+      return self.buffer_pool.acquire(shape, dtype)
+    return np.empty(shape, dtype)
+
+  def _recycle(self, data):
+    """Hand removed `data` back to the buffer pool, unless data still held shares its memory."""
+    if self.buffer_pool is not None:
+      with self._lock:
+        live = list(self._results.values())
+      self.buffer_pool.release(data, live=live)
+
+  def set_value_range(self, id: str, value_range: ValueRange):
+    """Record the known value range of the data registered under `id`."""
+    if not self.contains(id):
+      raise KeyError(f"Data with id {id} not found.")
+    self._value_ranges[id] = value_range
+
+  def value_range(self, id: str) -> Union[ValueRange, None]:
+    """The known value range of the data registered under `id`, None if unknown."""
+    return self._value_ranges.get(id)
   
   def register(self, id: Union[str, dict], data = None):
     if isinstance(id, str): self._register_individual(id, data)
@@ -36,11 +106,201 @@ class DataManager:
   
   def _register_individual(self, id: str, data):
     if id == "_": return # Ignore placeholder
-    if self.contains(id):
-      raise KeyError(f"Data with id {id} already exists.")
-    self._results[id] = data
+    with self._lock:
+      if self.contains(id):
+        raise KeyError(f"Data with id {id} already exists.")
+      self._store(id, data)
+
+  def _store(self, id: str, data):
+    with self._lock:
+      self._results[id] = data
+
+  def allocate(self, id: str, shape: tuple, dtype) -> np.ndarray:
+    """
+    Register an uninitialised array under `id` and return it for filling, e.g.
+    chunk by chunk along the first axis. `id` must not be read before it is filled.
+    """
+    data = self._empty(shape, dtype)
+    self._register_individual(id, data)
+    return data
 
   def serialize(self):
     pass
 
-data_managers["native"] = DataManager
\ No newline at end of file
+
+class HDF5DataManager(DataManager):
+  """
+  Data manager keeping arrays in RAM up to `memory_budget` bytes.
+
+  Past the budget the least-recently-used arrays are spilled into a chunked,
+  optionally compressed HDF5 scratch file in `scratch_dir`, and reloaded
+  lazily on `get()`. Non-array data always stays in RAM. The scratch file is
+  removed once the manager is closed or garbage collected.
+  """
+  def __init__(self,
+               memory_budget: int = 4 * 1024**3,
+               scratch_dir: Union[str, Path, None] = None,
+               compression: Union[str, None] = None,
+               compression_level: Union[int, None] = None,
+               chunk_frames: int = 1):
+    super().__init__()
+    if memory_budget < 0:
+      raise ValueError(f"memory_budget must be non-negative, got {memory_budget}.")
+    if chunk_frames < 1:
+      raise ValueError(f"chunk_frames must be positive, got {chunk_frames}.")
+    self.memory_budget = memory_budget
+    self.scratch_dir = Path(scratch_dir) if scratch_dir is not None else None
+    self.compression = compression
+    self.compression_level = compression_level
+    self.chunk_frames = chunk_frames
+
+    self._results = OrderedDict() # In-memory data, least recently used first
+    self._spilled = {} # id -> dataset name, for data only held on disk
+    self._datasets = {} # id -> dataset name, for every array written to disk
+    self._memory_usage = 0
+    self._file = None
+    self._finalizer = None
+
+  @property
+  def memory_usage(self) -> int:
+    """Bytes of array data currently held in RAM."""
+    return self._memory_usage
+
+  def contains(self, id):
+    return id in self._results or id in self._spilled
+
+  def registered_results(self):
+    with self._lock:
+      return list(self._results.keys()) + list(self._spilled.keys())
+
+  def remove(self, id) -> int:
+    with self._lock:
+      if not self.contains(id):
+        raise KeyError(f"Data with id {id} not found.")
+      data = self._results.get(id)
+      released = self._resident_bytes(data)
+      self._discard(id)
+      self._value_ranges.pop(id, None)
+      self._recycle(data)
+      return released
+
+  def get(self, id, writable: bool = False):
+    with self._lock:
+      if id in self._results:
+        self._results.move_to_end(id)
+        return self._read(self._results[id], writable)
+      if id not in self._spilled:
+        raise KeyError(f"Data with id {id} not found.")
+
+      data = self._file[self._spilled[id]][()]
+      if data.nbytes <= self.memory_budget:
+        # Reload into RAM, the on-disk copy stays valid as data is immutable
+        del self._spilled[id]
+        self._results[id] = data
+        self._memory_usage += data.nbytes
+        self._enforce_budget(keep=id)
+      return self._read(data, writable)
+
+  def _store(self, id: str, data):
+    with self._lock:
+      self._discard(id)
+      self._results[id] = data
+      self._memory_usage += self._resident_bytes(data)
+      self._enforce_budget()
+
+  def allocate(self, id: str, shape: tuple, dtype) -> Union[np.ndarray, "h5py.Dataset"]:
+    """
+    Register an uninitialised array under `id` and return it for filling.
+
+    Arrays not fitting the remaining budget are created directly in the scratch
+    file and returned as HDF5 dataset, so they never occupy RAM as a whole.
+    """
+    with self._lock:
+      if self.contains(id):
+        raise KeyError(f"Data with id {id} already exists.")
+      nbytes = math.prod(shape) * np.dtype(dtype).itemsize
+      if self._memory_usage + nbytes <= self.memory_budget or len(shape) == 0 or nbytes == 0:
+        data = self._empty(shape, dtype)
+        self._store(id, data)
+        return data
+
+      name = f"data_{len(self._datasets)}_{id.replace('/', '_')}"
+      chunks = (min(self.chunk_frames, shape[0]),) + tuple(shape[1:])
+      dataset = self._scratch_file().create_dataset(
+        name, shape=shape, dtype=dtype, chunks=chunks,
+        compression=self.compression, compression_opts=self.compression_level,
+      )
+      self._datasets[id] = self._spilled[id] = name
+      return dataset
+
+  def _discard(self, id: str):
+    if id in self._results:
+      self._memory_usage -= self._resident_bytes(self._results.pop(id))
+    self._spilled.pop(id, None)
+    name = self._datasets.pop(id, None)
+    if name is not None:
+      del self._file[name]
+
+  @staticmethod
+  def _resident_bytes(data) -> int:
+    return data.nbytes if isinstance(data, np.ndarray) else 0
+
+  @staticmethod
+  def _spillable(data) -> bool:
+    return isinstance(data, np.ndarray) and data.ndim > 0 and data.size > 0 \
+      and data.dtype.kind in "biuf"
+
+  def _enforce_budget(self, keep: Union[str, None] = None):
+    """Spill least-recently-used arrays until the RAM usage fits the budget."""
+    if self._memory_usage <= self.memory_budget:
+      return
+    for id in list(self._results.keys()):
+      if id == keep or not self._spillable(self._results[id]):
+        continue
+      self._spill(id)
+      if self._memory_usage <= self.memory_budget:
+        return
+
+  def _spill(self, id: str):
+    data = self._results.pop(id)
+    if id not in self._datasets:
+      name = f"data_{len(self._datasets)}_{id.replace('/', '_')}"
+      chunks = (min(self.chunk_frames, data.shape[0]),) + data.shape[1:]
+      self._scratch_file().create_dataset(
+        name, data=data, chunks=chunks,
+        compression=self.compression, compression_opts=self.compression_level,
+      )
+      self._datasets[id] = name
+    self._spilled[id] = self._datasets[id]
+    self._memory_usage -= data.nbytes
+
+  def _scratch_file(self) -> "h5py.File":
+    if self._file is None:
+      import h5py
+      handle = tempfile.NamedTemporaryFile(
+        prefix="data_manager_", suffix=".h5", dir=self.scratch_dir, delete=False
+      )
+      handle.close()
+      self._file = h5py.File(handle.name, "w")
+      self._finalizer = weakref.finalize(self, HDF5DataManager._remove_scratch, self._file, Path(handle.name))
+    return self._file
+
+  @staticmethod
+  def _remove_scratch(file: "h5py.File", path: Path):
+    file.close()
+    path.unlink(missing_ok=True)
+
+  def close(self):
+    """Drop all spilled data and remove the scratch file."""
+    with self._lock:
+      for id in list(self._spilled.keys()):
+        del self._spilled[id]
+      self._datasets.clear()
+      if self._finalizer is not None:
+        self._finalizer()
+      self._file = None
+      self._finalizer = None
+
+
+data_managers["native"] = DataManager
+data_managers["hdf5"] = HDF5DataManager
\ No newline at end of file
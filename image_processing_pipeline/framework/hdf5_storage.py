@@ -0,0 +1,39 @@
+import pickle
+import numpy as np
+
+from typing import TYPE_CHECKING
+from urllib.parse import quote, unquote
+
+if TYPE_CHECKING:
+  import h5py
+
+
+def write_value(group: "h5py.Group", name: str, value, **dataset_kwargs):
+  """
+  Store `value` as dataset `name` in `group`.
+
+  Numeric arrays are stored as native datasets, created with `dataset_kwargs`
+  (e.g. chunks or compression). Dicts with string keys become groups, storing
+  their entries recursively. Any other value is pickled into an opaque dataset,
+  so it is restored with its exact type.
+  """
+  if isinstance(value, np.ndarray) and value.ndim > 0 and value.dtype.kind in "biufc":
+    group.create_dataset(name, data=value, **dataset_kwargs)
+  elif type(value) is dict and all(isinstance(k, str) and k for k in value):
+    subgroup = group.create_group(name, track_order=True)
+    for k, v in value.items():
+      write_value(subgroup, quote(k, safe=""), v, **dataset_kwargs)
+  else:
+    dataset = group.create_dataset(name, data=np.void(pickle.dumps(value)))
+    dataset.attrs["encoding"] = "pickle"
+
+
+def read_value(group: "h5py.Group", name: str):
+  """Load a value stored with `write_value`."""
+  import h5py
+  dataset = group[name]
+  if isinstance(dataset, h5py.Group):
+    return {unquote(k): read_value(dataset, k) for k in dataset.keys()}
+  if dataset.attrs.get("encoding") == "pickle":
+    return pickle.loads(dataset[()].tobytes())
+  return dataset[()]
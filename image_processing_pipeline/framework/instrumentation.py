@@ -0,0 +1,177 @@
+import contextlib, json, os, sys, threading, time
+import numpy as np
+
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Union
+
+try:
+  import resource
+except ImportError: # Not available on Windows
+  resource = None
+
+
+def peak_rss() -> Union[int, None]:
+  """Peak resident set size of the process in bytes, None if unavailable."""
+  if resource is None:
+    return None
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return peak if sys.platform == "darwin" else peak * 1024 # Linux reports kB
+
+
+def describe(value) -> dict:
+  """Lightweight description of a data item: type, and for arrays dtype, shape and size."""
+  if isinstance(value, np.ndarray):
+    return {"type": "ndarray", "dtype": str(value.dtype), "shape": list(value.shape), "bytes": value.nbytes}
+  return {"type": type(value).__name__}
+
+
+@dataclass
+class StepRecord:
+  """
+  Performance record of one pipeline step.
+
+  Times are in seconds, `start` relative to the start of the run. `load_time`
+  covers the data manager reads (including copies) or the step cache lookup.
+  `peak_memory_delta` is the growth of the process' peak RSS during the step;
+  with concurrent steps it is attributed to whichever step raised the peak. It
+  is not measured for streamed steps, whose chunks interleave.
+  """
+  index: int
+  display_id: str
+  process_step: str
+  thread: str = ""
+  start: float = 0.
+  wall_time: float = 0.
+  cpu_time: float = 0.
+  load_time: float = 0.
+  peak_memory_delta: Union[int, None] = None
+  cached: bool = False
+  chunks: int = 0 # Chunks of frames a streamed step ran on, 0 if run on whole stacks
+  inputs: dict = field(default_factory=dict)
+  deliverables: dict = field(default_factory=dict)
+
+  @property
+  def input_bytes(self) -> int:
+    return sum(d.get("bytes", 0) for d in self.inputs.values())
+
+  @property
+  def deliverable_bytes(self) -> int:
+    return sum(d.get("bytes", 0) for d in self.deliverables.values())
+
+
+@dataclass
+class SerialisationRecord:
+  """Performance record of writing one `Serialisations` entry."""
+  target: str
+  start: float = 0.
+  wall_time: float = 0.
+  bytes: int = 0
+
+
+@contextlib.contextmanager
+def timed(record: Union[StepRecord, SerialisationRecord], origin: float):
+  """Measure wall time (and for steps CPU time and peak memory growth) of the enclosed block."""
+  is_step = isinstance(record, StepRecord)
+  if is_step:
+    record.thread = threading.current_thread().name
+    cpu_start, peak_start = time.thread_time(), peak_rss()
+  start = time.perf_counter()
+  try:
+    yield record
+  finally:
+    record.start = start - origin
+    record.wall_time = time.perf_counter() - start
+    if is_step:
+      record.cpu_time = time.thread_time() - cpu_start
+      if peak_start is not None:
+        record.peak_memory_delta = peak_rss() - peak_start
+
+
+@dataclass
+class PerformanceReport:
+  steps: list[StepRecord] = field(default_factory=list)
+  serialisations: list[SerialisationRecord] = field(default_factory=list)
+  wall_time: float = 0.
+  buffer_pool: dict = field(default_factory=dict) # Allocation statistics of the `BufferPool`
+
+  def to_dict(self) -> dict:
+    steps = []
+    for record in sorted(self.steps, key=lambda r: r.start):
+      entry = asdict(record)
+      entry["input_bytes"] = record.input_bytes
+      entry["deliverable_bytes"] = record.deliverable_bytes
+      steps.append(entry)
+    return {
+      "wall_time": self.wall_time,
+      "steps": steps,
+      "serialisations": [asdict(r) for r in self.serialisations],
+      "buffer_pool": self.buffer_pool,
+    }
+
+  def to_json(self, path: Union[str, Path]):
+    with open(path, "w") as f:
+      json.dump(self.to_dict(), f, indent=2)
+
+  def to_chrome_trace(self, path: Union[str, Path]):
+    """Write the report in the Chrome trace-event format (chrome://tracing, Perfetto)."""
+    pid = os.getpid()
+    threads = {}
+    events = []
+    for record in self.steps:
+      tid = threads.setdefault(record.thread, len(threads))
+      args = asdict(record)
+      events.append({
+        "name": record.display_id, "cat": record.process_step, "ph": "X", "pid": pid, "tid": tid,
+        "ts": record.start * 1e6, "dur": record.wall_time * 1e6, "args": args,
+      })
+      if record.load_time > 0:
+        events.append({
+          "name": "load", "cat": "data_manager", "ph": "X", "pid": pid, "tid": tid,
+          "ts": record.start * 1e6, "dur": record.load_time * 1e6,
+        })
+    tid = threads.setdefault("serialisation", len(threads))
+    for record in self.serialisations:
+      events.append({
+        "name": record.target, "cat": "serialisation", "ph": "X", "pid": pid, "tid": tid,
+        "ts": record.start * 1e6, "dur": record.wall_time * 1e6, "args": asdict(record),
+      })
+    for name, tid in threads.items():
+      events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}})
+    with open(path, "w") as f:
+      json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+  def __str__(self) -> str:
+    lines = [f"{'Step':<24}{'Wall [s]':>10}{'CPU [s]':>10}{'Load [s]':>10}{'Peak +MB':>10}{'Out MB':>10}"]
+    for r in sorted(self.steps, key=lambda r: r.index):
+      peak = f"{r.peak_memory_delta / 1e6:.1f}" if r.peak_memory_delta is not None else "-"
+      lines.append(
+        f"{r.display_id[:23]:<24}{r.wall_time:>10.3f}{r.cpu_time:>10.3f}{r.load_time:>10.3f}"
+        f"{peak:>10}{r.deliverable_bytes / 1e6:>10.1f}"
+      )
+    for r in self.serialisations:
+      lines.append(f"{'Save ' + r.target[:18]:<24}{r.wall_time:>10.3f}")
+    lines.append(f"{'Total':<24}{self.wall_time:>10.3f}")
+    return "\n".join(lines)
+
+
+class StepHook:
+  """
+  Base class of pipeline hooks, e.g. to export metrics.
+
+  Register instances in `FrameworkConfig.step_hooks` or through
+  `ProcessPipeline.add_hook`. With the threaded scheduler the step hooks are
+  called from the worker threads. Hooks are not stored in checkpoints, pass
+  them to `ProcessPipeline.resume` again.
+  """
+  def pre_step(self, index: int, step_config: dict):
+    """Called before step `index` (0-based) is executed."""
+    pass
+
+  def post_step(self, record: StepRecord):
+    """Called after a step finished successfully, with its performance record."""
+    pass
+
+  def on_run_end(self, report: PerformanceReport):
+    """Called after the results have been saved."""
+    pass
@@ -1,13 +1,22 @@
 import yaml
 import numpy as np
-import tifffile as tiff
 
 from abc import ABC, abstractmethod
+from concurrent.futures import Executor, Future
 from pathlib import Path
+from typing import Union
 
 from image_processing_pipeline.framework.data_manager import DataManager
+from image_processing_pipeline.framework.region_table import RegionTable
+from image_processing_pipeline.framework.typed_data_interface import TypedDataInterface
+from image_processing_pipeline.framework.value_range import ValueRange
 
 class AbstractProcessData(ABC):
+  # Key of a `Serialisations` entry holding options for this wrapper, None if it takes none
+  options_key: Union[str, None] = None
+  # Known value range of the data, see `ValueRange`
+  value_range: Union[ValueRange, None] = None
+
   def __init__(self, data, name: str):
     self.data = data
     self.name = name
@@ -81,29 +90,102 @@ class ProcessData(CollectableProcessData):
     return cls(data)
 
 
-class ProcessTiffData(AbstractProcessData):
-  def __init__(self, data: np.ndarray, name: str):
+class ProcessTiffData(AbstractProcessData, TypedDataInterface):
+  options_key = "TiffOptions"
+  options = {
+    "dtype": (str | None, None), # Output dtype. None picks the smallest of uint8/uint16/uint32 holding the maximum of integers, float32 for floats
+    "compression": (str | None, None), # tifffile codec, e.g. "zlib", "zstd" or "lzw"
+    "compression_level": (int | None, None),
+    "predictor": (bool, False), # Horizontal (floating point) differencing, helps compressing smooth images
+    "tile": (list | None, None), # [height, width] of tiles, multiples of 16
+    "bigtiff": (bool | str, "auto"), # "auto" writes BigTIFF if the output approaches the 4 GB limit of TIFF
+  }
+
+  def __init__(self, data: np.ndarray, name: str, options: Union[dict, None] = None):
     if not isinstance(data, np.ndarray):
       raise TypeError("ProcessTiffData expects a numpy.ndarray")
     if data.ndim not in (2, 3):
       raise ValueError("ProcessTiffData only supports 2D or 3D numpy arrays")
     super().__init__(data, name)
+    self._set_options(options or {})
+
+  def _set_options(self, options: dict):
+    self.options_actual = self.options.copy()
+    self.verify_and_add(self.options_actual, options, source=self.options_key)
+    if self.dtype is not None and np.dtype(self.dtype).kind not in "uif":
+      raise ValueError(f"{self.options_key} 'dtype' must be an integer or float type, got {self.dtype}.")
+    if self.tile is not None and (len(self.tile) != 2 or any(t <= 0 or t % 16 for t in self.tile)):
+      raise ValueError(f"{self.options_key} 'tile' must be [height, width] in multiples of 16, got {self.tile}.")
+    if self.bigtiff not in (True, False, "auto"):
+      raise ValueError(f"{self.options_key} 'bigtiff' must be true, false or 'auto', got {self.bigtiff}.")
+
+  @classmethod
+  def validate_options(cls, options: dict):
+    """Raise if `options` are not valid options of this wrapper."""
+    cls.__new__(cls)._set_options(options)
+
+  def _output_dtype(self) -> np.dtype:
+    if self.dtype is not None:
+      return np.dtype(self.dtype)
+    if self.data.dtype.kind in "ui":
+      if self.data.dtype == np.uint8 or (self.value_range is not None and self.value_range.high < 256):
+        return np.dtype("uint8") # Fits, no need to scan for the maximum
+      high = np.max(self.data, initial=0)
+      for dtype in (np.dtype("uint8"), np.dtype("uint16"), np.dtype("uint32")):
+        if high <= np.iinfo(dtype).max:
+          return dtype
+      raise ValueError(
+        f"Cannot serialise result {self.name} with values up to {high} as TIFF without truncating them. " +
+        "Set a 'dtype' in the TiffOptions."
+      )
+    if self.data.dtype.kind == "f":
+      return np.dtype("float32")
+    raise TypeError(
+      f"Cannot serialise result {self.name} of type {self.data.dtype}. " +
+      "Supported are float and int types."
+    )
+
+  def _segments(self, dtype: np.dtype):
+    """Pages (or tiles of pages) converted to `dtype` one at a time, in the order tifffile writes them."""
+    frames = self.data if self.data.ndim == 3 else self.data[None]
+    for frame in frames:
+      frame = frame.astype(dtype)
+      if self.tile is None:
+        yield frame
+        continue
+      height, width = self.tile
+      for y in range(0, frame.shape[0], height):
+        for x in range(0, frame.shape[1], width):
+          tile = np.zeros((height, width), dtype)
+          part = frame[y:y + height, x:x + width]
+          tile[:part.shape[0], :part.shape[1]] = part
+          yield tile
 
   def _serialise(self, dir: Path):
     """
     Save the numpy array as a TIFF file.
+
+    Data needing a dtype conversion (or not contiguous in memory) is converted
+    and written page by page, without a converted copy of the whole array.
     """
+    import tifffile as tiff
     tif_path = dir / f"{self.name}.tif"
-    if "int" in str(self.data.dtype):
-      int_type = "uint8" if np.max(self.data) < 256 else "uint16"
-      tiff.imwrite(tif_path, self.data.astype(int_type), photometric='minisblack')
-    elif "float" in str(self.data.dtype):
-      tiff.imwrite(tif_path, self.data.astype("float32"), photometric='minisblack')
+    dtype = self._output_dtype()
+    bigtiff = self.bigtiff
+    if bigtiff == "auto":
+      bigtiff = self.data.size * dtype.itemsize > 2**32 - 2**25 # Leave room for the headers
+    kwargs = {
+      "photometric": "minisblack",
+      "compression": self.compression,
+      "compressionargs": {"level": self.compression_level} if self.compression_level is not None else None,
+      "predictor": True if self.predictor else None,
+      "tile": tuple(self.tile) if self.tile is not None else None,
+      "bigtiff": bigtiff,
+    }
+    if self.data.dtype == dtype and self.data.flags.c_contiguous:
+      tiff.imwrite(tif_path, self.data, **kwargs)
     else:
-      raise TypeError(
-        f"Cannot serialise result {self.name} of type {self.data.dtype}. " +
-        "Supported are float and int types."
-      )
+      tiff.imwrite(tif_path, self._segments(dtype), shape=self.data.shape, dtype=dtype, **kwargs)
     return str(tif_path)
 
   @staticmethod
@@ -111,6 +193,7 @@ class ProcessTiffData(AbstractProcessData):
     """
     Load TIFF file back into numpy array.
     """
+    import tifffile as tiff
     with yaml_file.open("r") as f:
       meta = yaml.safe_load(f)
     
@@ -118,6 +201,30 @@ class ProcessTiffData(AbstractProcessData):
     return tiff.imread(tif_path)
 
 
+class ProcessRegionTableData(AbstractProcessData):
+  def __init__(self, data: RegionTable, name: str):
+    if not isinstance(data, RegionTable):
+      raise TypeError("ProcessRegionTableData expects a RegionTable")
+    super().__init__(data, name)
+
+  def _serialise(self, dir: Path):
+    """Save the columns of the table to a compressed `.npz` file."""
+    npz_path = dir / f"{self.name}.npz"
+    np.savez_compressed(npz_path, per_frame=self.data.per_frame,
+                        **{name: getattr(self.data, name) for name in self.data.columns})
+    return str(npz_path)
+
+  @staticmethod
+  def load(yaml_file: Path):
+    """
+    Load the `.npz` file back into a RegionTable.
+    """
+    with yaml_file.open("r") as f:
+      meta = yaml.safe_load(f)
+    with np.load(Path(meta["data"])) as columns:
+      return RegionTable(dict(columns))
+
+
 # --- Registry System ---
 
 class ProcessDataSerialiser:
@@ -135,13 +242,19 @@ class ProcessDataSerialiser:
   def get_data_cls(self, py_type: type):
     return self._registry.get(py_type, ProcessData)
 
-  def save(self, data: dict, details: dict, output_dir: Path):
+  def save(self, data: dict, details: dict, output_dir: Path, executor: Union[Executor, None] = None,
+           value_ranges: Union[dict, None] = None) -> list[Future]:
     """
     Save entries of `data` with a suitable AbstractProcessData wrapper.
+
+    With an `executor`, every file is written as a task of its own and the
+    futures are returned instead of waiting for the writes to finish. Known
+    `value_ranges` of the entries are handed to their wrappers.
     """
     target_dir = output_dir / details["RelativeOutputPath"]
     target_dir.mkdir(exist_ok=True, parents=True)
 
+    wrappers = []
     if "CollectTo" in details:
       collection = {}
       for k, v in data.items():
@@ -149,15 +262,35 @@ class ProcessDataSerialiser:
         if issubclass(wrapper_cls, CollectableProcessData):
           collection[k] = v
         else:
-          wrapper = wrapper_cls(v, k)
-          wrapper.serialise(target_dir)
-      collectionWrapper = ProcessData(collection, details["CollectTo"])
-      collectionWrapper.serialise(target_dir)
+          wrappers.append(self._wrap(wrapper_cls, v, k, details, value_ranges))
+      wrappers.append(ProcessData(collection, details["CollectTo"]))
     else:
       for k, v in data.items():
         wrapper_cls = self.get_data_cls(type(v))
-        wrapper = wrapper_cls(v, k)
+        wrappers.append(self._wrap(wrapper_cls, v, k, details, value_ranges))
+
+    if executor is None:
+      for wrapper in wrappers:
         wrapper.serialise(target_dir)
+      return []
+    return [executor.submit(wrapper.serialise, target_dir) for wrapper in wrappers]
+
+  @staticmethod
+  def _wrap(wrapper_cls: type[AbstractProcessData], data, name: str, details: dict,
+            value_ranges: Union[dict, None] = None) -> AbstractProcessData:
+    if wrapper_cls.options_key is None:
+      wrapper = wrapper_cls(data, name)
+    else:
+      wrapper = wrapper_cls(data, name, details.get(wrapper_cls.options_key))
+    if value_ranges and value_ranges.get(name) is not None:
+      wrapper.value_range = value_ranges[name]
+    return wrapper
+
+  def validate(self, details: dict):
+    """Check the wrapper options of a `Serialisations` entry."""
+    for wrapper_cls in set(self._registry.values()):
+      if wrapper_cls.options_key is not None and wrapper_cls.options_key in details:
+        wrapper_cls.validate_options(details[wrapper_cls.options_key])
 
   def load(self, yaml_file: Path):
     """
@@ -176,4 +309,5 @@ class ProcessDataSerialiser:
 
 # --- Register standard mappings ---
 process_data_serialiser = ProcessDataSerialiser()
-process_data_serialiser.register(np.ndarray, ProcessTiffData)
\ No newline at end of file
+process_data_serialiser.register(np.ndarray, ProcessTiffData)
+process_data_serialiser.register(RegionTable, ProcessRegionTableData)
\ No newline at end of file
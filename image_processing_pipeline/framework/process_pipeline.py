@@ -1,13 +1,29 @@
-import copy, math, yaml
+import dataclasses, heapq, math, threading, time, yaml
+import numpy as np
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Union
+from urllib.parse import quote, unquote
 
+from image_processing_pipeline.framework.buffer_pool import BufferPool
 from image_processing_pipeline.framework.config import FrameworkConfig
 from image_processing_pipeline.framework.process_data import ProcessDataSerialiser
 from image_processing_pipeline.framework.serilisable_inputs import SerialisableInputs
-from image_processing_pipeline.framework.data_manager import data_managers
+from image_processing_pipeline.framework.data_manager import DataManager, data_managers
+from image_processing_pipeline.framework.hdf5_storage import read_value, write_value
+from image_processing_pipeline.framework.instrumentation import (
+  PerformanceReport, SerialisationRecord, StepHook, StepRecord, describe, timed
+)
 from image_processing_pipeline.framework.process_step import process_steps
+from image_processing_pipeline.framework.result_container import ResultContainer
+from image_processing_pipeline.framework.step_cache import StepCache, digest_bytes, digest_value
+from image_processing_pipeline.framework.streaming import StreamSegment, plan_segments, run_segment
+
+import image_processing_pipeline.processes # Registers the built-in steps, imported when first used
 
-from image_processing_pipeline.processes import * # Ensure all processes are registered
+if TYPE_CHECKING:
+  import h5py
 
 class ProcessPipeline(SerialisableInputs):
   required_inputs = {
@@ -18,7 +34,9 @@ class ProcessPipeline(SerialisableInputs):
 
   optional_inputs = {
     "data_manager_type": (str, "native"),
+    "data_manager_options": (dict, {}),
     "framework_config": (FrameworkConfig, FrameworkConfig()),
+    "config": (dict | None, None), # Already parsed content of `config_path`, skips reading it
   }
 
   def on_init(self):
@@ -34,26 +52,41 @@ class ProcessPipeline(SerialisableInputs):
         f"Unknown data manager '{self.data_manager_type}'. "
         f"Available: {', '.join(data_managers.keys())}"
       )
-    self.data_manager = data_managers[self.data_manager_type](
-      # output_dir=self.output_dir, input_file=self.input_file
-      # TODO: define interface
-      # Idea: output_dir and compiled hdf5 file
-    )
+    self.data_manager = data_managers[self.data_manager_type](**self.data_manager_options)
     self.data_manager.register(self.inputs)
 
     # Load and validate config
     self.config = self._load_config()
     self._validate_inputs()
     self.pipeline_steps = self._validate_pipeline_steps()
+    self.step_float_dtypes = self._resolve_float_dtypes()
+    self.release_plan = self._plan_releases()
+    self.released_bytes = {}
+    self.completed_steps = set()
+    self.restored_from = None # Checkpoint the pipeline was resumed from
+
+    # Persistent cache of step results, keyed by digests of the data flowing through the pipeline
+    settings = self.framework_config.settings()
+    self.step_cache = None
+    if settings.get("cache_dir") is not None:
+      self.step_cache = StepCache(settings["cache_dir"], settings["cache_max_bytes"])
+    self.data_digests = {}
+    self.buffer_pool = None # Arrays reused as step outputs during a run, see `BufferPool`
+
+    self.hooks = list(self.framework_config.step_hooks)
+    self.performance_report = PerformanceReport()
     # TODO: validate Serialisations
 
   def _load_config(self) -> dict:
-    """Load YAML configuration file."""
-    with open(self.config_path, "r", encoding="utf-8") as f:
-      try:
-        config = yaml.safe_load(f)
-      except yaml.YAMLError as e:
-        raise ValueError(f"Invalid YAML in {self.config_path}: {e}")
+    """Load YAML configuration file, unless it was passed in parsed already."""
+    if self.config is not None:
+      config = self.config
+    else:
+      with open(self.config_path, "r", encoding="utf-8") as f:
+        try:
+          config = yaml.safe_load(f)
+        except yaml.YAMLError as e:
+          raise ValueError(f"Invalid YAML in {self.config_path}: {e}")
     
     required_keys = {"Inputs", "PipelineSteps"}
     missing = required_keys - config.keys()
@@ -98,8 +131,14 @@ class ProcessPipeline(SerialisableInputs):
 
     required_keys = {"DisplayId", "ProcessStep", "Deliverables"}
 
-    # Work on a copy of the data manager for validation purposes
-    dm_copy = copy.deepcopy(self.data_manager)
+    # Track availability with placeholders, avoiding a copy of the registered data
+    dm_copy = DataManager()
+    dm_copy.register({id: None for id in self.data_manager.registered_results()})
+
+    # Dataflow of the pipeline, used for the liveness analysis and scheduling. Steps are 0-indexed.
+    self.data_producers = {id: None for id in dm_copy.registered_results()}
+    self.data_consumers = {}
+    self.step_reads = []
 
     for i, step in enumerate(steps, start=1):
       if not isinstance(step, dict):
@@ -111,6 +150,9 @@ class ProcessPipeline(SerialisableInputs):
         )
 
       display_id = step["DisplayId"]
+      self.step_reads.append(set())
+      if "FloatDtype" in step:
+        self._check_float_dtype(step["FloatDtype"], f"Step '{display_id}' (#{i}) 'FloatDtype'")
 
       # Validate Inputs
       if "Inputs" in step:
@@ -124,7 +166,16 @@ class ProcessPipeline(SerialisableInputs):
               f"Step '{display_id}' (#{i}) requires input '{input}', "
               f"which is not available in data manager."
             )
-            
+          self.step_reads[-1].add(input)
+
+      # Options naming an available id are read from the data manager
+      for val in step.get("Options", {}).values():
+        if isinstance(val, str) and dm_copy.contains(val):
+          self.step_reads[-1].add(val)
+
+      for id in self.step_reads[-1]:
+        self.data_consumers.setdefault(id, set()).add(i - 1)
+
       # Register Deliverables
       deliverables = step["Deliverables"]
       if isinstance(deliverables, dict) is False:
@@ -137,12 +188,31 @@ class ProcessPipeline(SerialisableInputs):
           f"Step '{display_id}' (#{i}) tried to register a deliverable "
           f"that was already defined earlier. Details: {e}"
         )
+      self.data_producers.update({k: i - 1 for k in deliverables.values() if k != "_"})
 
     if "Serialisations" in self.config:
       self._validate_pipeline_serialisation(dm_copy)
 
     return steps
   
+  @staticmethod
+  def _check_float_dtype(dtype, source: str):
+    try:
+      valid = dtype is None or np.dtype(dtype).kind == "f"
+    except TypeError:
+      valid = False
+    if not valid:
+      raise ValueError(f"{source}: Invalid float dtype {dtype!r}. Must be a float type, e.g. 'float32'.")
+
+  def _resolve_float_dtypes(self) -> list:
+    """
+    Dtype of the float results of every step, from the precision policy in the
+    framework config, unless the step overrides it with `FloatDtype`.
+    """
+    default = self.framework_config.float_dtype
+    self._check_float_dtype(default, "FrameworkConfig.float_dtype")
+    return [step.get("FloatDtype", default) for step in self.pipeline_steps]
+
   def _validate_pipeline_serialisation(self, dm_copy):
     serialisations = self.config["Serialisations"]
     serialisation_targets = set()
@@ -155,48 +225,481 @@ class ProcessPipeline(SerialisableInputs):
     
     assert len(serialisation_targets) == 0, \
       f"Config tries to serialise\n\t{serialisation_targets},\nwhich aren't provided by any step."
+
+    pds = ProcessDataSerialiser()
+    for serialisation in serialisations:
+      pds.validate(serialisation)
+
+  def _plan_releases(self) -> dict[str, set[int]]:
+    """
+    Liveness analysis of the pipeline data.
+
+    Maps every releasable id to the steps that use it. Once all of them executed,
+    the id is dead and can be dropped from the data manager; in list order this is
+    right after its last use. Deliverables no step reads are used by their
+    producer only. Serialisation targets and pipeline inputs are never released.
+    """
+    pinned = self._serialised_ids()
+    release_plan = {}
+    for id, producer in self.data_producers.items():
+      if producer is None or id in pinned:
+        continue
+      release_plan[id] = set(self.data_consumers.get(id, set())) or {producer}
+    return release_plan
+
+  def _serialised_ids(self) -> set[str]:
+    return {key for target in self.config.get("Serialisations", []) for key in target["Data"]}
+
+  def _release_data(self, step_idx: int, display_id: str, pending_uses: dict[str, set[int]]) -> list[str]:
+    """Drop the data, which step `step_idx` used last, recording the reclaimed bytes."""
+    released = []
+    for id, uses in pending_uses.items():
+      if step_idx in uses:
+        uses.discard(step_idx)
+        if not uses:
+          released.append(id)
+    for id in released:
+      del pending_uses[id]
+    # Data streamed through a segment of frame-local steps was never registered
+    released = [id for id in released if self.data_manager.contains(id)]
+    self.released_bytes[display_id] = sum(self.data_manager.remove(id) for id in released)
+    return released
+
+  def _step_dependencies(self) -> list[set[int]]:
+    """For every step, the indices of the steps producing the data it reads."""
+    return [
+      {self.data_producers[id] for id in reads if self.data_producers[id] is not None}
+        for reads in self.step_reads
+    ]
+
+  @staticmethod
+  def _format_bytes(n_bytes: int) -> str:
+    if n_bytes < 1000:
+      return f"{n_bytes} B"
+    for unit in ["kB", "MB", "GB", "TB"]:
+      n_bytes /= 1000
+      if n_bytes < 1000:
+        break
+    return f"{n_bytes:.1f} {unit}"
   
+  def add_hook(self, hook: StepHook):
+    """Register a hook called before and after every step, see `StepHook`."""
+    self.hooks.append(hook)
+
   def run(self):
+    run_start = time.perf_counter()
+    self.performance_report = report = PerformanceReport()
+    settings = self.framework_config.settings()
     total_steps = len(self.pipeline_steps)
-    width = self.framework_config.execution_settings["counter_width"] or \
-      math.floor(math.log10(total_steps) + 1)
+    width = settings["counter_width"] or math.floor(math.log10(total_steps) + 1)
+    release_intermediates = settings["release_intermediates"]
+    scheduler = settings["scheduler"]
+    if scheduler not in {"sequential", "threaded"}:
+      raise ValueError(f"Unknown scheduler '{scheduler}'. Supported: sequential, threaded")
+
+    # Runs of frame-local steps are streamed in chunks of frames, or else fused into cache-sized
+    # blocks. Fusion is skipped where whole deliverables of every step are needed (step cache).
+    chunk_frames = settings.get("stream_chunk_frames")
+    block_bytes = settings["fuse_block_bytes"]
+    segments = {}
+    if chunk_frames is not None:
+      if scheduler != "sequential":
+        raise ValueError("Streaming frame-local steps ('stream_chunk_frames') requires the sequential scheduler.")
+      if chunk_frames < 1:
+        raise ValueError(f"'stream_chunk_frames' must be positive, got {chunk_frames}.")
+    elif block_bytes is not None and block_bytes < 1:
+      raise ValueError(f"'fuse_block_bytes' must be positive, got {block_bytes}.")
+    if chunk_frames is not None or (block_bytes is not None and scheduler == "sequential" and self.step_cache is None):
+      segments = {
+        segment.steps[0]: segment for segment in plan_segments(
+          self.pipeline_steps, self.data_consumers, self._serialised_ids(), self.completed_steps
+        )
+      }
+
+    checkpoint_path = settings.get("checkpoint_path")
+    if checkpoint_path is not None:
+      checkpoint_path = Path(checkpoint_path)
+      if self.restored_from is not None and checkpoint_path.resolve() == self.restored_from.resolve():
+        import h5py
+        with h5py.File(checkpoint_path, "a") as f:
+          f.attrs["config"] = yaml.safe_dump(self.config) # Completed steps were validated against it
+      else:
+        self.serialise(checkpoint_path)
+
+    # Released arrays are handed back by the data manager, to be reused as outputs of later steps
+    if settings["buffer_pool_bytes"] != 0:
+      self.buffer_pool = BufferPool(settings["buffer_pool_bytes"])
+    self.data_manager.buffer_pool = self.buffer_pool
+
+    # Steps completed before, e.g. when resuming, have used their data already
+    pending_uses = {
+      id: uses - self.completed_steps for id, uses in self.release_plan.items() if uses - self.completed_steps
+    }
+    release_lock = threading.Lock()
+    checkpoint_lock = threading.Lock()
+
+    # Results are written on a thread pool, each target as soon as all its data is available
+    container = None
+    if settings.get("results_container") is not None:
+      container = ResultContainer(self.output_dir / settings["results_container"])
+      save = lambda data, target, value_ranges: container.save(data, target, writer)
+    else:
+      pds = ProcessDataSerialiser()
+      save = lambda data, target, value_ranges: pds.save(data, target, self.output_dir, writer, value_ranges)
+    serialisation_workers = settings.get("serialisation_workers")
+    writer = None
+    if serialisation_workers != 0:
+      writer = ThreadPoolExecutor(max_workers=serialisation_workers, thread_name_prefix="serialisation")
+    serialisation_targets = self.config.get("Serialisations", [])
+    unsaved_targets = list(range(len(serialisation_targets)))
+    writes = []
+    serialisation_lock = threading.Lock()
+
+    def save_targets(final: bool):
+      """Start writing the targets whose data is complete, or all remaining ones if `final`."""
+      with serialisation_lock:
+        for n in list(unsaved_targets):
+          target = serialisation_targets[n]
+          if not final and not all(self.data_manager.contains(key) for key in target["Data"]):
+            continue
+          unsaved_targets.remove(n)
+          record = SerialisationRecord(target["RelativeOutputPath"])
+          report.serialisations.append(record)
+          with timed(record, run_start):
+            data = {key: self.data_manager.get(key) for key in target["Data"] if self.data_manager.contains(key)}
+            futures = save(data, target, {key: self.data_manager.value_range(key) for key in data})
+          record.bytes = sum(describe(value).get("bytes", 0) for value in data.values())
+          for future in futures:
+            future.add_done_callback(
+              lambda _, record=record: setattr(record, "wall_time", time.perf_counter() - run_start - record.start)
+            )
+          writes.extend(futures)
+          if not final:
+            print(" " * (2*width + 3) + f" Saving {target['RelativeOutputPath']}")
+
+    def begin_step(idx: int) -> StepRecord:
+      step_config = self.pipeline_steps[idx]
+      print(f"[{idx + 1:>{width}}/{total_steps:{width}}] Executing: {step_config['DisplayId']}")
+      for hook in self.hooks:
+        hook.pre_step(idx, step_config)
+      return StepRecord(idx, step_config["DisplayId"], step_config["ProcessStep"])
+
+    def run_step(idx: int):
+      record = begin_step(idx)
+      with timed(record, run_start):
+        self._execute_step(idx, record)
+      finish_step(idx, record)
+
+    def run_segment_steps(segment: StreamSegment):
+      steps = f"{segment.steps[0] + 1}-{segment.steps[-1] + 1}"
+      if chunk_frames is not None:
+        print("[" + (2*width + 1)*"=" + f"] Streaming steps {steps} in chunks of {chunk_frames} frames")
+      else:
+        print("[" + (2*width + 1)*"=" + f"] Fusing steps {steps} in blocks of {self._format_bytes(block_bytes)}")
+      records = {idx: begin_step(idx) for idx in segment.steps}
+      start = time.perf_counter()
+      streamed = run_segment(
+        segment, self.pipeline_steps, self.step_reads, self.data_manager, chunk_frames, records,
+        value_ranges=not self.framework_config.pedantic_value_checks, float_dtypes=self.step_float_dtypes,
+        block_bytes=block_bytes
+      )
+      if not streamed:
+        print(" " * (2*width + 3) + " No common frame count, executing on whole stacks")
+      for idx, record in records.items():
+        if streamed:
+          record.start, record.thread = start - run_start, threading.current_thread().name
+        else:
+          with timed(record, run_start):
+            self._execute_step(idx, record)
+        finish_step(idx, record)
 
+    def finish_step(idx: int, record: StepRecord):
+      display_id = record.display_id
+      report.steps.append(record)
+      if record.cached:
+        print(" " * (2*width + 3) + " Loaded deliverables from step cache")
+
+      with checkpoint_lock:
+        self.completed_steps.add(idx)
+        if checkpoint_path is not None:
+          self._write_checkpoint(checkpoint_path, idx)
+
+      if release_intermediates:
+        with release_lock:
+          released = self._release_data(idx, display_id, pending_uses)
+        if released:
+          print(" " * (2*width + 3) + f" Released {', '.join(released)} " +
+                f"({self._format_bytes(self.released_bytes[display_id])})")
+
+      if writer is not None:
+        save_targets(final=False)
+
+      for hook in self.hooks:
+        hook.post_step(record)
+
+    failed = False
     try:
-      for idx, step_config in enumerate(self.pipeline_steps, start=1):
-        display_id = step_config["DisplayId"]
-        process_name = step_config["ProcessStep"]
-
-        # Print formatted step info
-        print(f"[{idx:>{width}}/{total_steps:{width}}] Executing: {display_id}")
-
-        if process_name not in process_steps:
-          raise ValueError(f"Unknown ProcessStep '{process_name}' in step {idx}")
-
-        # Prepare kwargs for instantiation
-        kwargs = {"delivers_id_map": step_config["Deliverables"]}
-        if "Inputs" in step_config:
-          kwargs["inputs"] = {k: self.data_manager.get(v) for k, v in step_config["Inputs"].items()}
-        if "Options" in step_config:
-          kwargs["options"] = {
-            id: self.data_manager.get(val) if isinstance(val, str) and self.data_manager.contains(val) else val \
-              for id, val in step_config["Options"].items() # Read from data manager if id is present
-          }
-
-        # Instantiate and execute
-        process_class = process_steps[process_name]
-        current_process = process_class(**kwargs)
-        deliverables = current_process.execute()
-        self.data_manager.register(deliverables)
-    except Exception as e:
-      raise e
+      if scheduler == "sequential":
+        streamed = set()
+        for idx in range(total_steps):
+          if idx in segments:
+            run_segment_steps(segments[idx])
+            streamed.update(segments[idx].steps)
+          elif idx not in self.completed_steps and idx not in streamed:
+            run_step(idx)
+      else:
+        self._run_threaded(run_step, settings.get("max_workers"), settings.get("memory_ceiling"))
+    except BaseException:
+      failed = True
+      raise
     finally:
+      if self.step_cache is not None:
+        print("[" + (2*width + 1)*"=" + f"] Step cache: {len(self.step_cache.hits)} hits, " +
+              f"{len(self.step_cache.misses)} misses")
+      if self.buffer_pool is not None:
+        report.buffer_pool = self.buffer_pool.statistics()
+        print("[" + (2*width + 1)*"=" + f"] Buffer pool: {self.buffer_pool.allocations} allocations " +
+              f"({self._format_bytes(self.buffer_pool.allocated_bytes)}), {self.buffer_pool.reuses} reuses " +
+              f"({self._format_bytes(self.buffer_pool.reused_bytes)})")
+        self.buffer_pool.clear()
+        self.data_manager.buffer_pool = self.buffer_pool = None
       print("[" + (2*width + 1)*"=" + "] Saving results")
-      
-      pds = ProcessDataSerialiser()
-      serialisation_targets = self.config["Serialisations"]
-      for target in serialisation_targets:
-        data = {key: self.data_manager.get(key) for key in target["Data"] if self.data_manager.contains(key)}
-        pds.save(data, target, self.output_dir)
-  
-  def serialise(self, path):
-    pass
\ No newline at end of file
+
+      # Wait for all writes. A failed write is raised, unless the run failed already
+      try:
+        save_targets(final=True)
+      finally:
+        errors = [future.exception() for future in writes if future.exception() is not None]
+        if writer is not None:
+          writer.shutdown()
+        if container is not None:
+          container.close()
+
+      report.wall_time = time.perf_counter() - run_start
+      self._write_performance_report(report)
+      for hook in self.hooks:
+        hook.on_run_end(report)
+
+      for error in errors[1:] if not failed else errors:
+        print(f"Failed to save results: {type(error).__name__}: {error}")
+      if errors and not failed:
+        raise errors[0]
+
+  def _write_performance_report(self, report: PerformanceReport):
+    settings = self.framework_config.settings()
+    if settings.get("report_path") is not None:
+      report.to_json(settings["report_path"])
+    if settings.get("trace_path") is not None:
+      report.to_chrome_trace(settings["trace_path"])
+
+  def _execute_step(self, idx: int, record: StepRecord):
+    """
+    Instantiate and execute step `idx`, registering its deliverables.
+
+    Deliverables are loaded from the step cache instead, if possible. Details
+    on data sizes, load times and cache use are filled into `record`.
+    """
+    step_config = self.pipeline_steps[idx]
+    process_name = step_config["ProcessStep"]
+    if process_name not in process_steps:
+      raise ValueError(f"Unknown ProcessStep '{process_name}' in step {idx + 1}")
+
+    process_class = process_steps[process_name]
+
+    load_start = time.perf_counter()
+    cache_key = None
+    if self.step_cache is not None:
+      cache_key = self._cache_key(idx, process_class)
+      cached = self.step_cache.load(cache_key, step_config["DisplayId"])
+      if cached is not None:
+        record.load_time = time.perf_counter() - load_start
+        record.cached = True
+        record.deliverables = {name: describe(value) for name, value in cached.items()}
+        self._register_deliverables(idx, cached, cache_key)
+        return
+
+    # Prepare kwargs for instantiation. Only mutated inputs are copied.
+    kwargs = {
+      "delivers_id_map": step_config["Deliverables"], "float_dtype": self.step_float_dtypes[idx],
+      "buffer_pool": self.buffer_pool,
+    }
+    if "Inputs" in step_config:
+      kwargs["inputs"] = {
+        k: self.data_manager.get(v, writable=k in process_class.mutated_inputs) \
+          for k, v in step_config["Inputs"].items()
+      }
+      kwargs["input_ranges"] = {
+        k: self.data_manager.value_range(v) for k, v in step_config["Inputs"].items() \
+          if self.data_manager.value_range(v) is not None
+      }
+    if "Options" in step_config:
+      reads = self.step_reads[idx]
+      kwargs["options"] = {
+        id: self.data_manager.get(val) if isinstance(val, str) and val in reads else val \
+          for id, val in step_config["Options"].items() # Read from data manager if id is present
+      }
+    record.load_time = time.perf_counter() - load_start
+    record.inputs = {name: describe(value) for name, value in kwargs.get("inputs", {}).items()}
+
+    current_process = process_class(**kwargs)
+    current_process.execute()
+    deliverables = {name: getattr(current_process, name) for name in step_config["Deliverables"]}
+    record.deliverables = {name: describe(value) for name, value in deliverables.items()}
+    if cache_key is not None:
+      self.step_cache.store(cache_key, deliverables)
+    self._register_deliverables(idx, deliverables, cache_key, current_process.deliverable_ranges)
+
+  def _register_deliverables(self, idx: int, deliverables: dict, cache_key: Union[str, None],
+                             value_ranges: Union[dict, None] = None):
+    """
+    Register deliverables, given by deliverable name, under the ids of step `idx`.
+
+    Their `value_ranges` are kept as well, unless values are checked pedantically.
+    """
+    id_map = self.pipeline_steps[idx]["Deliverables"]
+    self.data_manager.register({id_map[name]: value for name, value in deliverables.items()})
+    if value_ranges and not self.framework_config.pedantic_value_checks:
+      for name, value_range in value_ranges.items():
+        if id_map.get(name, "_") != "_":
+          self.data_manager.set_value_range(id_map[name], value_range)
+    if cache_key is not None:
+      # Deliverables are identified by the step execution producing them
+      for name, id in id_map.items():
+        self.data_digests[id] = digest_bytes(cache_key.encode(), name.encode())
+
+  def _data_digest(self, id: str) -> str:
+    if id not in self.data_digests: # Pipeline inputs are hashed on first use
+      self.data_digests[id] = digest_value(self.data_manager.get(id))
+    return self.data_digests[id]
+
+  def _cache_key(self, idx: int, process_class: type) -> str:
+    step_config = self.pipeline_steps[idx]
+    reads = self.step_reads[idx]
+    inputs = {name: self._data_digest(id) for name, id in step_config.get("Inputs", {}).items()}
+    options = {
+      name: f"<data {self._data_digest(val)}>" if isinstance(val, str) and val in reads else val \
+        for name, val in step_config.get("Options", {}).items()
+    }
+    if self.step_float_dtypes[idx] is not None: # Precision changes the results
+      options["<FloatDtype>"] = str(np.dtype(self.step_float_dtypes[idx]))
+    return StepCache.key(process_class, inputs, options, list(step_config["Deliverables"]))
+
+  def _run_threaded(self, run_step, max_workers: Union[int, None], memory_ceiling: Union[int, None]):
+    """
+    Run the steps on a thread pool, as soon as the data they read is available.
+
+    Ready steps are started in list order. While the data manager holds more than
+    `memory_ceiling` bytes, no further step is started unless none is running.
+    """
+    dependencies = [set(deps) - self.completed_steps for deps in self._step_dependencies()]
+    dependents = [[] for _ in dependencies]
+    for idx, deps in enumerate(dependencies):
+      for dep in deps:
+        dependents[dep].append(idx)
+
+    ready = [idx for idx, deps in enumerate(dependencies) if not deps and idx not in self.completed_steps]
+    heapq.heapify(ready)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline_step") as pool:
+      while ready or running:
+        while ready and not (running and memory_ceiling is not None and \
+                             self.data_manager.memory_usage > memory_ceiling):
+          idx = heapq.heappop(ready)
+          running[pool.submit(run_step, idx)] = idx
+
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in sorted(done, key=running.get):
+          idx = running.pop(future)
+          if future.exception() is not None:
+            # Let running steps finish, but start no new ones
+            wait(running)
+            raise future.exception()
+          for dependent in dependents[idx]:
+            dependencies[dependent].discard(idx)
+            if not dependencies[dependent]:
+              heapq.heappush(ready, dependent)
+
+  def serialise(self, path: Path):
+    """
+    Snapshot the pipeline into a HDF5 file.
+
+    Stores the init arguments, the config, the completed steps and every
+    deliverable held by the data manager. `resume` continues from the snapshot.
+    """
+    import h5py
+    with h5py.File(path, "w") as f:
+      self.write_init_kwargs(f)
+      f.attrs["config"] = yaml.safe_dump(self.config)
+      f.attrs["completed_steps"] = np.array(sorted(self.completed_steps), dtype=np.int64)
+      data = f.create_group("data")
+      for id in self.data_manager.registered_results():
+        if self.data_producers.get(id) is not None: # Inputs are part of the init arguments
+          self._write_checkpoint_data(data, id)
+
+  def _write_checkpoint_data(self, group: "h5py.Group", id: str):
+    key = quote(id, safe="")
+    write_value(group, key, self.data_manager.get(id))
+    if id in self.data_digests:
+      group[key].attrs["digest"] = self.data_digests[id]
+
+  def _write_checkpoint(self, path: Path, idx: int):
+    """Add the deliverables of step `idx` to the checkpoint and mark the step completed."""
+    import h5py
+    with h5py.File(path, "a") as f:
+      data = f["data"]
+      for id in self.pipeline_steps[idx]["Deliverables"].values():
+        if self.data_manager.contains(id) and quote(id, safe="") not in data:
+          self._write_checkpoint_data(data, id)
+      f.attrs["completed_steps"] = np.array(sorted(self.completed_steps), dtype=np.int64)
+
+  def _stored_init_kwargs(self) -> dict:
+    # Hooks are live objects, possibly not picklable, and are never loaded from a file.
+    # `resume` takes them as an argument instead.
+    kwargs = dict(self.init_kwargs)
+    if "framework_config" in kwargs:
+      kwargs["framework_config"] = dataclasses.replace(kwargs["framework_config"], step_hooks=[])
+    return kwargs
+
+  @classmethod
+  def resume(cls, checkpoint_path: Path, permit_version_changes: bool = False,
+             hooks: Iterable[StepHook] = ()) -> "ProcessPipeline":
+    """
+    Continue a run from a checkpoint, written during `run()` or by `serialise()`.
+
+    The pipeline is recreated from the stored init arguments, which reloads and
+    validates the config. Steps completed in the checkpoint must be unchanged in
+    the config. Their deliverables, which are still needed, are restored and the
+    remaining steps are executed. Step hooks are not stored in checkpoints, the
+    `hooks` given are registered for the resumed run.
+    """
+    checkpoint_path = Path(checkpoint_path)
+    pipeline = cls.reload(checkpoint_path, permit_version_changes)
+    for hook in hooks:
+      pipeline.add_hook(hook)
+    pipeline._restore_checkpoint(checkpoint_path)
+    pipeline.run()
+    return pipeline
+
+  def _restore_checkpoint(self, path: Path):
+    import h5py
+    with h5py.File(path, "r") as f:
+      completed_steps = {int(idx) for idx in f.attrs["completed_steps"]}
+      checkpoint_steps = yaml.safe_load(f.attrs["config"])["PipelineSteps"]
+      for idx in sorted(completed_steps):
+        if idx >= len(self.pipeline_steps) or checkpoint_steps[idx] != self.pipeline_steps[idx]:
+          raise ValueError(
+            f"Step #{idx + 1} completed in checkpoint {path} differs from the config "
+            f"{self.config_path}. Cannot resume."
+          )
+
+      self.completed_steps = completed_steps
+      self.restored_from = path
+      data = f["data"]
+      for key in data.keys():
+        id = unquote(key)
+        uses = self.release_plan.get(id)
+        if uses is not None and not uses - completed_steps:
+          continue # Dead, no remaining step reads it
+        self.data_manager.register(id, read_value(data, key))
+        if "digest" in data[key].attrs:
+          self.data_digests[id] = data[key].attrs["digest"]
\ No newline at end of file
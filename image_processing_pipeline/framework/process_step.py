@@ -1,10 +1,78 @@
-import re
+import importlib, re
+import numpy as np
 
 from abc import ABC, abstractmethod
+from collections.abc import MutableMapping
+from importlib.metadata import entry_points
+from typing import TYPE_CHECKING, Union
 
 from image_processing_pipeline.framework.typed_data_interface import TypedDataInterface
+from image_processing_pipeline.framework.value_range import ValueRange
 
-process_steps = {}
+if TYPE_CHECKING:
+  from image_processing_pipeline.framework.buffer_pool import BufferPool
+
+
+class ProcessStepRegistry(MutableMapping):
+  """
+  Maps step names to step classes, importing the module of a step on its first lookup.
+
+  Step modules register their classes on import with `process_steps["Name"] = Name`.
+  Steps known by module only are added with `register_lazy`. Steps of other
+  packages are discovered through entry points of the group `entry_point_group`,
+  pointing to the step class (`"Name = package.module:Name"`) or to a module
+  registering it.
+  """
+  entry_point_group = "image_processing_pipeline.process_steps"
+
+  def __init__(self):
+    self._classes = {}
+    self._modules = {}
+    self._entry_points = None
+
+  def register_lazy(self, name: str, module: str):
+    """Register step `name`, defined in `module`, without importing the module."""
+    self._modules[name] = module
+
+  def _discovered(self) -> dict:
+    if self._entry_points is None:
+      self._entry_points = {ep.name: ep for ep in entry_points(group=self.entry_point_group)}
+    return self._entry_points
+
+  def __getitem__(self, name: str) -> type:
+    if name not in self._classes:
+      if name in self._modules:
+        importlib.import_module(self._modules[name])
+      elif name in self._discovered():
+        loaded = self._discovered()[name].load()
+        if isinstance(loaded, type):
+          self._classes.setdefault(name, loaded)
+      else:
+        raise KeyError(name)
+      if name not in self._classes:
+        raise ImportError(f"Importing the module of ProcessStep '{name}' did not register it.")
+    return self._classes[name]
+
+  def __contains__(self, name) -> bool:
+    return name in self._classes or name in self._modules or name in self._discovered()
+
+  def __setitem__(self, name: str, process_class: type):
+    self._classes[name] = process_class
+
+  def __delitem__(self, name: str):
+    if name not in self:
+      raise KeyError(name)
+    for names in (self._classes, self._modules, self._discovered()):
+      names.pop(name, None)
+
+  def __iter__(self):
+    return iter(dict.fromkeys([*self._classes, *self._modules, *self._discovered()]))
+
+  def __len__(self) -> int:
+    return len(dict.fromkeys([*self._classes, *self._modules, *self._discovered()]))
+
+
+process_steps = ProcessStepRegistry()
 
 class AbstractProcessStep(ABC, TypedDataInterface):
   inputs: dict[str, type] = {}
@@ -12,15 +80,43 @@ class AbstractProcessStep(ABC, TypedDataInterface):
 
   options: dict[str, tuple[type, any]] = {}
 
+  # Inputs the step writes into. Only these receive a private, writable copy;
+  # all other array inputs are read-only views of the data manager's contents.
+  mutated_inputs: set[str] = set()
+
+  # Steps computing every frame of their array deliverables from the same frame of
+  # their array inputs only. The pipeline may run chains of them on chunks of frames,
+  # see `framework.streaming`. Non-array deliverables must not depend on the chunk.
+  frame_local: bool = False
+
+  # Frame-local steps computing every element of their array deliverables from the
+  # same element of their array inputs only. Fused chains of them may run on parts of frames.
+  elementwise: bool = False
+
+  # Frames to deliver, set when a frame-local step without array inputs (a source,
+  # e.g. `LoadStack`) is run on chunks of frames. See `frame_count`.
+  frame_range: Union[slice, None] = None
+
   def __init__(self,
                inputs: dict = None,
                options: dict = None,
-               delivers_id_map: dict = None):
+               delivers_id_map: dict = None,
+               input_ranges: dict[str, ValueRange] = None,
+               float_dtype: Union[str, np.dtype, None] = None,
+               buffer_pool: Union["BufferPool", None] = None):
     # Create copies to avoid modification of class variables
     self.inputs_actual = self.inputs.copy()
     self.deliverables_actual = self.deliverables.copy()
     self.options_actual = self.options.copy()
 
+    # Known value ranges of inputs, and those of deliverables set by `_execute` (by name)
+    self.input_ranges = input_ranges or {}
+    self.deliverable_ranges: dict[str, ValueRange] = {}
+    # Dtype of float results (the precision policy), None for the step's own choice
+    self.float_dtype = np.dtype(float_dtype) if float_dtype is not None else None
+    # Source of output arrays, see `_empty`
+    self.buffer_pool = buffer_pool
+
     self.delivers_id_map = delivers_id_map or {}
     self.verify_and_add(self.inputs_actual, inputs or {}, source="Inputs")
     self._on_set_inputs() # Provide hook for sub classes
@@ -41,6 +137,37 @@ class AbstractProcessStep(ABC, TypedDataInterface):
     """Hook for subclasses to react to options being set."""
     pass
 
+  def _values_within(self, name: str, low: float, high: float) -> bool:
+    """Whether all values of input `name` lie in [low, high], by its known range or a scan."""
+    known = self.input_ranges.get(name)
+    if known is not None and known.within(low, high):
+      return True
+    values = getattr(self, name)
+    return values.size == 0 or bool(values.min() >= low and values.max() <= high)
+
+  def _is_binary(self, name: str) -> bool:
+    """Whether input `name` holds only 0 and 1, by its dtype, its known range or a scan."""
+    values = getattr(self, name)
+    known = self.input_ranges.get(name)
+    if values.dtype == bool or (known is not None and known.binary and known.within(0, 1)):
+      return True
+    return bool(np.all((values == 0) | (values == 1)))
+
+  def _empty(self, shape: tuple, dtype) -> np.ndarray:
+    """An uninitialised output array, reused from the pipeline's buffer pool if possible."""
+    if self.buffer_pool is not None:
+      return self.buffer_pool.acquire(shape, dtype)
+    return np.empty(shape, dtype)
+
+  def _recycle(self, array: np.ndarray):
+    """Hand a scratch array taken with `_empty` back to the buffer pool. It must not be used afterwards."""
+    if self.buffer_pool is not None:
+      self.buffer_pool.release(array)
+
+  def frame_count(self) -> Union[int, None]:
+    """Number of frames a frame-local source delivers in total, None for other steps."""
+    return None
+
   def execute(self):
     self._execute()
     self._validate_deliverables()
@@ -0,0 +1,110 @@
+import numpy as np
+
+
+class RegionTable:
+  """
+  Properties of the labelled regions of a stack, one row per region, held column by column.
+
+  Regions are labelled either per frame (`per_frame`, every region lies in one
+  frame) or across frames, but their labels are unique in the stack. Columns:
+    - label: label of the region in the labelled stack,
+    - frame, frame_stop: first frame of the region and the frame after its last,
+    - x0, x1, y0, y1: bounding box along the first (X) and second (Y) axis of the frames, stops exclusive,
+    - area: area of the bounding box in pixels, (x1 - x0) * (y1 - y0),
+    - pixel_count: number of pixels of the region, in all its frames,
+    - centroid_frame, centroid_x, centroid_y: mean position of its pixels.
+
+  Tables are immutable, their columns read-only, so the data manager hands out
+  the table itself instead of a copy.
+  """
+  int_columns = ("label", "frame", "frame_stop", "x0", "x1", "y0", "y1", "area", "pixel_count")
+  float_columns = ("centroid_frame", "centroid_x", "centroid_y")
+  columns = int_columns + float_columns
+
+  def __init__(self, data: dict):
+    """Table of the columns in `data`, sequences of equal length, and its `per_frame` flag (default true)."""
+    missing = [name for name in self.columns if name not in data]
+    if missing:
+      raise ValueError(f"Missing columns of RegionTable: {', '.join(missing)}")
+    self.per_frame = bool(data.get("per_frame", True))
+    for name in self.columns:
+      column = np.array(data[name], dtype=np.int64 if name in self.int_columns else np.float64).reshape(-1)
+      column.flags.writeable = False
+      setattr(self, name, column)
+    if len({len(getattr(self, name)) for name in self.columns}) > 1:
+      raise ValueError("All columns of a RegionTable must be of equal length.")
+
+  @classmethod
+  def from_labels(cls, labelled: np.ndarray, per_frame: bool = True) -> "RegionTable":
+    """
+    Table of the regions of the stack `labelled`, labelled 1 to n (0 is background).
+
+    All columns are gathered in one pass over the labelled pixels of every frame,
+    with `bincount` and `minimum.at` / `maximum.at` over the labels in the frame,
+    instead of one slice object per region as from `find_objects`.
+    """
+    n = int(labelled.max()) if labelled.size else 0
+    counts, sums = np.zeros(n + 1, np.int64), np.zeros((3, n + 1))
+    # Bounds along the frame, first (X) and second (Y) axis, inclusive
+    lows, highs = np.full((3, n + 1), np.iinfo(np.int64).max), np.full((3, n + 1), -1)
+    width = labelled.shape[2]
+    for f, frame in enumerate(labelled):
+      pixels = np.flatnonzero(frame)
+      if pixels.size == 0:
+        continue
+      labels = frame.ravel()[pixels]
+      low, high = int(labels.min()), int(labels.max())
+      labels = labels - low # Index into the labels low to high, seen in this frame
+      count = np.bincount(labels, minlength=high - low + 1)
+      present = count > 0
+      counts[low:high + 1] += count
+      sums[0, low:high + 1] += f * count
+      np.minimum(lows[0, low:high + 1], f, out=lows[0, low:high + 1], where=present)
+      np.maximum(highs[0, low:high + 1], f, out=highs[0, low:high + 1], where=present)
+      for axis, coordinate in ((1, pixels // width), (2, pixels % width)):
+        sums[axis, low:high + 1] += np.bincount(labels, weights=coordinate, minlength=high - low + 1)
+        np.minimum.at(lows[axis, low:high + 1], labels, coordinate)
+        np.maximum.at(highs[axis, low:high + 1], labels, coordinate)
+
+    label = np.flatnonzero(counts) # Labels in use
+    lows, highs, counts = lows[:, label], highs[:, label] + 1, counts[label]
+    centroids = sums[:, label] / np.maximum(counts, 1)
+    return cls({
+      "per_frame": per_frame, "label": label,
+      "frame": lows[0], "frame_stop": highs[0],
+      "x0": lows[1], "x1": highs[1], "y0": lows[2], "y1": highs[2],
+      "area": (highs[1] - lows[1]) * (highs[2] - lows[2]),
+      "pixel_count": counts,
+      "centroid_frame": centroids[0], "centroid_x": centroids[1], "centroid_y": centroids[2],
+    })
+
+  def __len__(self) -> int:
+    return len(self.label)
+
+  def __repr__(self) -> str:
+    return f"RegionTable({len(self)} regions, per_frame={self.per_frame})"
+
+  def __deepcopy__(self, memo):
+    return self # Immutable
+
+  def slices(self, row: int) -> tuple[slice, slice, slice]:
+    """Bounding box of the region in `row`, as slices of the stack."""
+    return (slice(int(self.frame[row]), int(self.frame_stop[row])),
+            slice(int(self.x0[row]), int(self.x1[row])), slice(int(self.y0[row]), int(self.y1[row])))
+
+  def lookup(self, values, background=0) -> np.ndarray:
+    """
+    Array holding `values` (one per row) at the labels of the rows, and `background`
+    at all other labels, so indexing it by a labelled stack maps every pixel to its region's value.
+    """
+    values = np.asarray(values)
+    table = np.full(int(self.label.max(initial=0)) + 1, background, dtype=values.dtype)
+    table[self.label] = values
+    return table
+
+  def to_records(self) -> np.ndarray:
+    """The table as a structured array, a field per column."""
+    records = np.empty(len(self), dtype=[(name, getattr(self, name).dtype) for name in self.columns])
+    for name in self.columns:
+      records[name] = getattr(self, name)
+    return records
@@ -0,0 +1,185 @@
+import threading, yaml
+import numpy as np
+
+from concurrent.futures import Executor, Future
+from pathlib import Path
+from typing import TYPE_CHECKING, Union
+from urllib.parse import quote, unquote
+
+from image_processing_pipeline.framework.process_data import CollectableProcessData, ProcessDataSerialiser
+from image_processing_pipeline.framework.region_table import RegionTable
+
+if TYPE_CHECKING:
+  import h5py
+
+# Compression of array datasets, shuffled bytes compress better with gzip
+ARRAY_COMPRESSION = {"compression": "gzip", "compression_opts": 4, "shuffle": True}
+
+
+class ResultContainer:
+  """
+  Writes all results of a run into one HDF5 file, instead of a `.yaml` (and
+  `.tif`) file per result.
+
+  Every `Serialisations` entry becomes the group `RelativeOutputPath`, holding
+  one node per result with its type name in the `type` attribute:
+    - numeric arrays as compressed datasets, chunked by frame (keeping their dtype),
+    - numbers and numeric lists or tuples as small datasets,
+    - region tables as compressed datasets of records, a field per column,
+    - other values as YAML text, as in the sidecar files,
+    - results collected with `CollectTo` as a group of such nodes.
+
+  Use `load_result` to read results back, arrays optionally only in part.
+  """
+
+  def __init__(self, path: Union[str, Path]):
+    self.path = Path(path)
+    self.file = None
+    self.lock = threading.Lock() # One writer at a time, h5py does not write concurrently
+
+  def save(self, data: dict, details: dict, executor: Union[Executor, None] = None) -> list[Future]:
+    """
+    Write the entries of `data` into the group of the `Serialisations` entry `details`.
+
+    With an `executor`, the entries are written as one task and its future is
+    returned instead of waiting for the write to finish.
+    """
+    if executor is None:
+      self._write(data, details)
+      return []
+    return [executor.submit(self._write, data, details)]
+
+  def _write(self, data: dict, details: dict):
+    with self.lock:
+      if self.file is None:
+        import h5py
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = h5py.File(self.path, "w")
+      group = self.file.require_group(_group_name(details["RelativeOutputPath"]))
+
+      if "CollectTo" in details:
+        serialiser = ProcessDataSerialiser()
+        collection = {
+          k: v for k, v in data.items() if issubclass(serialiser.get_data_cls(type(v)), CollectableProcessData)
+        }
+        data = {k: v for k, v in data.items() if k not in collection}
+        collected = _replace_node(group, details["CollectTo"], create_group=True)
+        collected.attrs["type"] = "builtins.dict"
+        for k, v in collection.items():
+          _write_result(collected, k, v)
+
+      for k, v in data.items():
+        _write_result(group, k, v)
+      self.file.flush()
+
+  def close(self):
+    with self.lock:
+      if self.file is not None:
+        self.file.close()
+        self.file = None
+
+
+def _group_name(relative_output_path: str) -> str:
+  return "/" + "/".join(part for part in Path(relative_output_path).parts if part not in (".", "/"))
+
+
+def _type_name(value) -> str:
+  return f"{type(value).__module__}.{type(value).__qualname__}"
+
+
+def _replace_node(group: "h5py.Group", name: str, create_group: bool = False, **dataset_kwargs):
+  """Create the node `name` in `group`, replacing a node of the same name written before."""
+  key = quote(name, safe="")
+  if key in group:
+    del group[key]
+  if create_group:
+    return group.create_group(key, track_order=True)
+  return group.create_dataset(key, **dataset_kwargs)
+
+
+def _write_result(group: "h5py.Group", name: str, value):
+  if isinstance(value, np.ndarray) and value.dtype.kind in "biuf":
+    kwargs = {}
+    if value.size > 0 and value.ndim > 0:
+      chunks = (1,) + value.shape[1:] if value.ndim == 3 else True # Frame by frame for stacks
+      kwargs = {"chunks": chunks, **ARRAY_COMPRESSION}
+    dataset = _replace_node(group, name, data=value, **kwargs)
+  elif isinstance(value, RegionTable):
+    kwargs = ARRAY_COMPRESSION if len(value) > 0 else {}
+    dataset = _replace_node(group, name, data=value.to_records(), **kwargs)
+    dataset.attrs["encoding"] = "columns"
+    dataset.attrs["per_frame"] = value.per_frame
+  else:
+    numeric = _numeric(value)
+    if numeric is not None:
+      dataset = _replace_node(group, name, data=numeric)
+    else:
+      dataset = _replace_node(group, name, data=yaml.safe_dump(value))
+      dataset.attrs["encoding"] = "yaml"
+  dataset.attrs["type"] = _type_name(value)
+
+
+def _numeric(value) -> Union[np.ndarray, None]:
+  """`value` as a numeric array if it is a number or a regular list or tuple of numbers."""
+  if not isinstance(value, (int, float, np.number, list, tuple)):
+    return None
+  try:
+    array = np.asarray(value)
+  except ValueError: # Ragged
+    return None
+  return array if array.dtype.kind in "biuf" else None
+
+
+def load_result(path: Union[str, Path], name: str, selection=None):
+  """
+  Load the result `name`, given as `RelativeOutputPath/name`, from a result container.
+
+  A `selection` (an index, slice or tuple of them, as for numpy arrays) reads
+  only that part of an array, e.g. `selection=5` reads frame 5 of a stack.
+  Results collected with `CollectTo` are loaded as a dict, or individually
+  as `RelativeOutputPath/CollectTo/name`.
+  """
+  import h5py
+  *parents, leaf = Path(name).as_posix().strip("/").split("/")
+  key = "/".join([*parents, quote(leaf, safe="")])
+  with h5py.File(path, "r") as f:
+    if key not in f:
+      raise KeyError(f"No result '{name}' in {path}.")
+    return _read_result(f[key], selection)
+
+
+def _read_result(node: Union["h5py.Group", "h5py.Dataset"], selection):
+  import h5py
+  type_name = node.attrs.get("type")
+  if isinstance(node, h5py.Group):
+    if selection is not None:
+      raise ValueError(f"Cannot select part of collected results {node.name}.")
+    return {unquote(k): _read_result(node[k], None) for k in node.keys()}
+  if type_name == "numpy.ndarray":
+    return node[()] if selection is None else node[selection]
+
+  if selection is not None:
+    raise ValueError(f"Cannot select part of result {node.name} of type {type_name}.")
+  if node.attrs.get("encoding") == "yaml":
+    data = yaml.safe_load(node.asstr()[()])
+  elif node.attrs.get("encoding") == "columns":
+    records = node[()]
+    data = {"per_frame": bool(node.attrs["per_frame"]), **{name: records[name] for name in records.dtype.names}}
+  else:
+    data = node[()].tolist()
+  module_name, _, class_name = type_name.rpartition(".")
+  module = __import__(module_name, fromlist=[class_name])
+  return getattr(module, class_name)(data)
+
+
+def result_names(path: Union[str, Path]) -> list[str]:
+  """Names of all results in a result container, to be passed to `load_result`."""
+  import h5py
+  names = []
+  def visit(name: str, node):
+    if "type" in node.attrs:
+      parent, _, leaf = name.rpartition("/")
+      names.append(f"{parent}/{unquote(leaf)}" if parent else unquote(leaf))
+  with h5py.File(path, "r") as f:
+    f.visititems(visit)
+  return names
@@ -1,16 +1,21 @@
-import h5py
-
 from abc import ABC, abstractmethod
 from pathlib import Path
+from typing import TYPE_CHECKING
 
+from image_processing_pipeline.framework.hdf5_storage import read_value, write_value
 from image_processing_pipeline.framework.typed_data_interface import TypedDataInterface
 
+if TYPE_CHECKING:
+  import h5py
+
 
 class SerialisableInputs(ABC, TypedDataInterface):
   required_inputs: dict[str, type] = {}
   optional_inputs: dict[str, tuple[type, object]] = {}
 
   def __init__(self, **kwargs):
+    self.init_kwargs = dict(kwargs) # Kept to recreate the instance in `reload`
+
     # Validate required inputs
     unhandled_kwargs = self.verify_and_add(
       self.required_inputs, kwargs, source="Inputs", extra_okay=True
@@ -20,43 +25,53 @@ class SerialisableInputs(ABC, TypedDataInterface):
     )
     
     self.on_init()
-    # self.serialise()
 
-  @classmethod
-  def reload(cls, path: Path, permit_version_changes: bool = False):
-    pass
-    # if not path.exists():
-    #   raise FileNotFoundError(f"HDF5 file not found: {path}")
+  @staticmethod
+  def _package_version() -> str:
+    from image_processing_pipeline import __version__
+    return __version__
 
-    # with h5py.File(path, "r") as f:
-    #   if "git_version" not in f.attrs:
-    #     raise ValueError("HDF5 file missing required 'git_version' attribute.")
+  def write_init_kwargs(self, f: "h5py.File"):
+    """Store the package version and the init arguments of the instance in `f`."""
+    f.attrs["package_version"] = self._package_version()
+    write_value(f, "init_kwargs", self._stored_init_kwargs())
 
-    #   file_git_hash = f.attrs["git_version"]
+  def _stored_init_kwargs(self) -> dict:
+    """Init arguments written by `write_init_kwargs`, subclasses may leave out those not to be stored."""
+    return self.init_kwargs
 
-    #   # Get local git hash
-    #   repo = git.Repo(search_parent_directories=True)
-    #   local_git_hash = repo.head.commit.hexsha
+  @classmethod
+  def read_init_kwargs(cls, f: "h5py.File", permit_version_changes: bool = False) -> dict:
+    """Load init arguments stored with `write_init_kwargs`, checking the package version."""
+    if "package_version" not in f.attrs:
+      raise ValueError("HDF5 file missing required 'package_version' attribute.")
+
+    file_version = f.attrs["package_version"]
+    local_version = cls._package_version()
+    if file_version != local_version:
+      msg = (
+        f"Version mismatch: file was written by version {file_version}, "
+        f"installed is {local_version}"
+      )
+      if permit_version_changes:
+        import warnings
+        warnings.warn(msg, UserWarning)
+      else:
+        raise ValueError(msg)
 
-    #   if file_git_hash != local_git_hash:
-    #     msg = (
-    #       f"Git version mismatch: file has {file_git_hash}, "
-    #       f"local repo is {local_git_hash}"
-    #     )
-    #     if permit_version_changes:
-    #       import warnings
-    #       warnings.warn(msg, UserWarning)
-    #     else:
-    #       raise ValueError(msg)
+    return read_value(f, "init_kwargs")
 
-    #   # Collect all non-version attributes
-    #   init_kwargs = {}
-    #   for key, val in f.attrs.items():
-    #     if key == "git_version":
-    #       continue
-    #     init_kwargs[key] = val
+  @classmethod
+  def reload(cls, path: Path, permit_version_changes: bool = False):
+    """Recreate an instance from a HDF5 file written by `serialise`."""
+    path = Path(path)
+    if not path.exists():
+      raise FileNotFoundError(f"HDF5 file not found: {path}")
 
-    # return cls(**init_kwargs)
+    import h5py
+    with h5py.File(path, "r") as f:
+      init_kwargs = cls.read_init_kwargs(f, permit_version_changes)
+    return cls(**init_kwargs)
 
   @abstractmethod
   def serialise(self, path: Path):
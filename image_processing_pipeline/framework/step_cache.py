@@ -0,0 +1,176 @@
+import hashlib, inspect, json, os, pickle, sys, threading, uuid
+import numpy as np
+
+from pathlib import Path
+from typing import Union
+
+from image_processing_pipeline.framework.hdf5_storage import read_value, write_value
+from image_processing_pipeline.framework.process_step import AbstractProcessStep
+
+
+def digest_bytes(*parts: bytes) -> str:
+  hasher = hashlib.blake2b(digest_size=20)
+  for part in parts:
+    hasher.update(part)
+  return hasher.hexdigest()
+
+
+def digest_value(value) -> str:
+  """
+  Content digest of a pipeline input.
+
+  Arrays are hashed frame by frame, including dtype and shape. Paths are
+  identified by their resolved location, size and modification time rather than
+  their content, so large input files are not read just to compute the key.
+  """
+  hasher = hashlib.blake2b(digest_size=20)
+  if isinstance(value, np.ndarray):
+    hasher.update(f"ndarray|{value.dtype.str}|{value.shape}".encode())
+    for frame in (value if value.ndim > 1 else [value]):
+      hasher.update(np.ascontiguousarray(frame).data)
+  elif isinstance(value, Path):
+    stat = value.stat()
+    hasher.update(f"path|{value.resolve()}|{stat.st_size}|{stat.st_mtime_ns}".encode())
+  else:
+    hasher.update(b"pickle|" + pickle.dumps(value))
+  return hasher.hexdigest()
+
+
+_source_digests = {}
+
+def source_digest(process_class: type) -> str:
+  """
+  Digest of the code determining the results of `process_class`.
+
+  Covers the whole source of the modules defining the class and the step classes
+  it derives from, and of the modules of the same package they use (e.g. helper
+  classes and module constants), followed through the names bound in them. Also
+  covers the versions of the package, numpy and scipy.
+  """
+  if process_class not in _source_digests:
+    import scipy
+    from image_processing_pipeline import __version__
+    roots = [klass.__module__ for klass in process_class.__mro__ if issubclass(klass, AbstractProcessStep)]
+    sources = [f"image_processing_pipeline {__version__}|numpy {np.__version__}|scipy {scipy.__version__}"]
+    for name in _used_modules(roots):
+      try:
+        sources.append(f"{name}|{inspect.getsource(sys.modules[name])}")
+      except (OSError, TypeError): # Source unavailable, fall back to the module identity
+        sources.append(name)
+    _source_digests[process_class] = digest_bytes(*(s.encode() for s in sources))
+  return _source_digests[process_class]
+
+
+def _used_modules(roots: list[str]) -> list[str]:
+  """
+  Names of the modules `roots` and, recursively, the modules of their top-level
+  package whose classes, functions or other objects they bind, sorted. Packages
+  are not followed, so the result does not depend on the modules imported elsewhere.
+  """
+  found, pending = set(), list(roots)
+  while pending:
+    name = pending.pop()
+    module = sys.modules.get(name)
+    if name in found or module is None:
+      continue
+    found.add(name)
+    package = name.partition(".")[0]
+    for value in vars(module).values():
+      if inspect.ismodule(value):
+        used = None if hasattr(value, "__path__") else value.__name__
+      else:
+        used = getattr(value, "__module__", None)
+      if isinstance(used, str) and used.partition(".")[0] == package:
+        pending.append(used)
+  return sorted(found)
+
+
+class StepCache:
+  """
+  Persistent, content-addressed cache of step deliverables.
+
+  Entries are keyed by the process class, the code it depends on (see `source_digest`), the resolved options
+  and the digests of its inputs, and stored as one HDF5 file each in `cache_dir`.
+  Once the cache exceeds `max_bytes`, the least recently used entries are evicted.
+  """
+  suffix = ".h5"
+
+  def __init__(self, cache_dir: Union[str, Path], max_bytes: Union[int, None] = None):
+    self.cache_dir = Path(cache_dir)
+    self.cache_dir.mkdir(parents=True, exist_ok=True)
+    self.max_bytes = max_bytes
+    self.hits = []
+    self.misses = []
+    self._lock = threading.Lock()
+
+  @staticmethod
+  def key(process_class: type, inputs: dict[str, str], options: dict, deliverables: list[str]) -> str:
+    """
+    Cache key of a step execution.
+
+    `inputs` maps input names to the digests of their data, `options` holds the
+    option values, with data read from the data manager replaced by its digest.
+    """
+    material = json.dumps({
+      "process": f"{process_class.__module__}.{process_class.__qualname__}",
+      "source": source_digest(process_class),
+      "inputs": inputs,
+      "options": options,
+      "deliverables": sorted(deliverables),
+    }, sort_keys=True, default=repr)
+    return digest_bytes(material.encode())
+
+  def _entry_path(self, key: str) -> Path:
+    return self.cache_dir / f"{key}{self.suffix}"
+
+  def load(self, key: str, display_id: str) -> Union[dict, None]:
+    """Return the cached deliverables (by deliverable name) for `key`, or None on a miss."""
+    import h5py
+    path = self._entry_path(key)
+    try:
+      with h5py.File(path, "r") as f:
+        deliverables = {name: read_value(f, name) for name in f.keys()}
+      os.utime(path) # Mark as recently used
+    except OSError: # Missing or unreadable entry
+      with self._lock:
+        self.misses.append(display_id)
+      return None
+    with self._lock:
+      self.hits.append(display_id)
+    return deliverables
+
+  def store(self, key: str, deliverables: dict):
+    """Store deliverables (by deliverable name) under `key`, then enforce the size bound."""
+    import h5py
+    path = self._entry_path(key)
+    tmp_path = path.with_name(f".{uuid.uuid4().hex}.tmp")
+    try:
+      with h5py.File(tmp_path, "w") as f:
+        for name, value in deliverables.items():
+          write_value(f, name, value)
+      os.replace(tmp_path, path) # Atomic, concurrent readers never see partial entries
+    finally:
+      tmp_path.unlink(missing_ok=True)
+    self._evict()
+
+  def _evict(self):
+    if self.max_bytes is None:
+      return
+    with self._lock:
+      entries = []
+      for path in self.cache_dir.glob(f"*{self.suffix}"):
+        try:
+          stat = path.stat()
+        except FileNotFoundError: # Evicted concurrently
+          continue
+        entries.append((stat.st_mtime_ns, stat.st_size, path))
+      total = sum(size for _, size, _ in entries)
+      for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+        if total <= self.max_bytes:
+          break
+        path.unlink(missing_ok=True)
+        total -= size
+
+  def report(self) -> dict:
+    """Hits and misses of this cache instance, by step DisplayId."""
+    return {"hits": list(self.hits), "misses": list(self.misses)}
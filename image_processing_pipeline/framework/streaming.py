@@ -0,0 +1,248 @@
+import math, time
+import numpy as np
+
+from dataclasses import dataclass, field
+from typing import Union
+
+from image_processing_pipeline.framework.data_manager import DataManager
+from image_processing_pipeline.framework.instrumentation import StepRecord
+from image_processing_pipeline.framework.process_step import process_steps
+
+
+@dataclass
+class StreamSegment:
+  """
+  Consecutive frame-local steps, executed together on chunks of frames, or
+  fused into blocks of a cache-sized number of bytes.
+
+  Only `outputs`, the data read after the segment or serialised, is assembled
+  in the data manager. All other data produced in the segment exists one chunk
+  at a time.
+  """
+  steps: list[int]
+  outputs: set[str] = field(default_factory=set)
+
+
+def plan_segments(pipeline_steps: list[dict],
+                  data_consumers: dict[str, set[int]],
+                  pinned: set[str],
+                  skip: set[int] = frozenset()) -> list[StreamSegment]:
+  """
+  Group runs of consecutive frame-local steps into segments of at least two steps.
+
+  Steps in `skip` (e.g. completed before) are never part of a segment.
+  """
+  segments, current = [], []
+  for idx, step in enumerate(pipeline_steps + [None]): # Sentinel closes the last run
+    process_class = process_steps.get(step["ProcessStep"]) if step is not None else None
+    if process_class is not None and process_class.frame_local and idx not in skip:
+      current.append(idx)
+      continue
+    if len(current) > 1:
+      segments.append(StreamSegment(current))
+    current = []
+
+  for segment in segments:
+    members = set(segment.steps)
+    for idx in segment.steps:
+      for id in pipeline_steps[idx]["Deliverables"].values():
+        if id != "_" and (id in pinned or data_consumers.get(id, set()) - members):
+          segment.outputs.add(id)
+  return segments
+
+
+def _frame_stack(value, n_frames: int) -> bool:
+  return isinstance(value, np.ndarray) and value.ndim > 0 and value.shape[0] == n_frames
+
+
+def _blocks(n_frames: int, chunk_frames: Union[int, None], block_bytes: Union[int, None],
+            frame_bytes: dict, n_rows: Union[int, None]):
+  """
+  Index of every block a segment is executed on, a tuple of slices.
+
+  Blocks are `chunk_frames` frames each, or as many frames as fit `block_bytes`
+  by `frame_bytes["max"]`, the largest size of a frame of the segment's data seen
+  so far (updated while iterating, None if not seen yet). With `n_rows`, frames
+  larger than `block_bytes` are split into bands of rows.
+  """
+  start = 0
+  while start < n_frames:
+    size = frame_bytes["max"]
+    if chunk_frames is not None:
+      count = chunk_frames
+    elif size is None:
+      count = 1
+    elif n_rows is not None and size > block_bytes:
+      rows = max(1, block_bytes // max(1, size // n_rows))
+      for row in range(0, n_rows, rows):
+        yield slice(start, start + 1), slice(row, min(row + rows, n_rows))
+      start += 1
+      continue
+    else:
+      count = max(1, block_bytes // max(1, size))
+    yield slice(start, min(start + count, n_frames)),
+    start += count
+
+
+def run_segment(segment: StreamSegment,
+                pipeline_steps: list[dict],
+                step_reads: list[set[str]],
+                data_manager: DataManager,
+                chunk_frames: Union[int, None],
+                records: dict[int, StepRecord],
+                value_ranges: bool = True,
+                float_dtypes: Union[list, None] = None,
+                block_bytes: Union[int, None] = None) -> bool:
+  """
+  Execute `segment` chunk by chunk, registering its outputs in `data_manager`.
+
+  Chunks are `chunk_frames` frames each. Without `chunk_frames`, the steps are
+  fused: chunks are sized to `block_bytes` per array, and are bands of rows of
+  a frame if the frames are larger and all steps are elementwise.
+
+  Data read from the data manager is sliced per chunk if it is a stack with
+  as many frames as the segment, and passed on whole otherwise. Returns False,
+  without executing anything, if the frame count cannot be determined or the
+  stacks read disagree in it; the steps must then be executed as usual.
+
+  With `value_ranges`, the known value ranges of data are passed to the steps,
+  and the ranges of the outputs, as delivered for every chunk, are registered.
+  `float_dtypes` holds the dtype of float results of every step, see `ProcessPipeline`.
+  """
+  produced = {id for idx in segment.steps for id in pipeline_steps[idx]["Deliverables"].values()}
+  external = {
+    id: data_manager.get(id) for idx in segment.steps for id in step_reads[idx] if id not in produced
+  }
+
+  # Frame count of the segment, from the stacks read or the sources
+  depths = {v.shape[0] for v in external.values() if isinstance(v, np.ndarray) and v.ndim > 0}
+  for idx in segment.steps:
+    process_class = process_steps[pipeline_steps[idx]["ProcessStep"]]
+    if step_reads[idx] & produced:
+      continue
+    kwargs = _step_kwargs(pipeline_steps[idx], step_reads[idx], external)
+    if not any(isinstance(v, np.ndarray) for v in kwargs.get("inputs", {}).values()):
+      depths.add(process_class(**kwargs).frame_count())
+  if len(depths) != 1 or None in depths or 0 in depths:
+    return False
+  n_frames = depths.pop()
+
+  external_ranges = {}
+  if value_ranges:
+    external_ranges = {
+      id: data_manager.value_range(id) for id in external if data_manager.value_range(id) is not None
+    }
+  output_ranges = {} # id -> union of the ranges of all chunks, None if unknown for a chunk
+
+  stacks = [value for value in external.values() if _frame_stack(value, n_frames)]
+  frame_bytes = {"max": max((value[0].nbytes for value in stacks), default=None)}
+  n_rows = None
+  if all(process_steps[pipeline_steps[idx]["ProcessStep"]].elementwise for idx in segment.steps) \
+    and stacks and all(value.ndim > 1 and value.shape[1:] == stacks[0].shape[1:] for value in stacks):
+    n_rows = stacks[0].shape[1]
+
+  buffers = {}
+  registered = [] # Outputs registered so far, incomplete until all blocks ran
+  try:
+    for index in _blocks(n_frames, chunk_frames, block_bytes, frame_bytes, n_rows):
+      frames = index[0]
+      block_shape = tuple(s.stop - s.start for s in index)
+      first = all(s.start == 0 for s in index)
+      chunk = {
+        id: value[index] if _frame_stack(value, n_frames) else value for id, value in external.items()
+      }
+      chunk_ranges = dict(external_ranges)
+      for idx in segment.steps:
+        step_config = pipeline_steps[idx]
+        process_class = process_steps[step_config["ProcessStep"]]
+        record = records[idx]
+        step_start, cpu_start = time.perf_counter(), time.thread_time()
+
+        kwargs = _step_kwargs(step_config, step_reads[idx], chunk, process_class.mutated_inputs, chunk_ranges)
+        kwargs["float_dtype"] = float_dtypes[idx] if float_dtypes is not None else None
+        kwargs["buffer_pool"] = data_manager.buffer_pool
+        is_source = not any(isinstance(v, np.ndarray) for v in kwargs.get("inputs", {}).values())
+        process = process_class(**kwargs)
+        if is_source:
+          process.frame_range = frames
+        process.execute()
+
+        for name, id in step_config["Deliverables"].items():
+          if id == "_":
+            continue
+          value = chunk[id] = getattr(process, name)
+          value_range = process.deliverable_ranges.get(name) if value_ranges else None
+          if value_range is not None:
+            chunk_ranges[id] = value_range
+          else:
+            chunk_ranges.pop(id, None)
+          if id in segment.outputs:
+            if first:
+              output_ranges[id] = value_range
+            elif output_ranges[id] is not None and value_range is not None:
+              output_ranges[id] = output_ranges[id].union(value_range)
+            else:
+              output_ranges[id] = None
+          if isinstance(value, np.ndarray) and value.ndim > 0:
+            if value.shape[:len(index)] != block_shape:
+              raise ValueError(
+                f"Step '{step_config['DisplayId']}' is frame-local, but delivered '{name}' of shape "
+                f"{value.shape} for a chunk of shape {block_shape}."
+              )
+            size = value.nbytes // math.prod(block_shape) * (n_rows if len(index) > 1 else 1)
+            frame_bytes["max"] = max(frame_bytes["max"] or 0, size)
+            if id in segment.outputs:
+              if id not in buffers:
+                shape = (n_frames,) + value.shape[1:] if len(index) == 1 else (n_frames, n_rows) + value.shape[2:]
+                buffers[id] = data_manager.allocate(id, shape, value.dtype)
+                registered.append(id)
+              elif buffers[id].dtype != value.dtype:
+                raise TypeError(
+                  f"Step '{step_config['DisplayId']}' delivered '{name}' as {value.dtype} for frames "
+                  f"{frames.start}-{frames.stop - 1}, but as {buffers[id].dtype} before."
+                )
+              buffers[id][index] = value
+          elif id in segment.outputs and first:
+            data_manager.register(id, value)
+            registered.append(id)
+
+        record.wall_time += time.perf_counter() - step_start
+        record.cpu_time += time.thread_time() - cpu_start
+        record.chunks += 1
+
+      # Data of a chunk is not used past it, array outputs have been copied into their buffers
+      if data_manager.buffer_pool is not None:
+        for id in produced:
+          if isinstance(chunk.get(id), np.ndarray) and chunk[id].ndim > 0:
+            data_manager.buffer_pool.release(chunk[id])
+  except BaseException:
+    # Do not leave partly filled outputs behind, to be read or saved as results
+    for id in registered:
+      data_manager.remove(id)
+    raise
+
+  for id, value_range in output_ranges.items():
+    if value_range is not None:
+      data_manager.set_value_range(id, value_range)
+  return True
+
+
+def _step_kwargs(step_config: dict, reads: set[str], data: dict, mutated_inputs: set[str] = frozenset(),
+                 ranges: dict = None) -> dict:
+  """
+  Instantiation arguments of a step, with its inputs and data options taken
+  from `data`, and the value ranges of its inputs from `ranges`.
+  """
+  kwargs = {"delivers_id_map": step_config["Deliverables"]}
+  if "Inputs" in step_config:
+    kwargs["inputs"] = {
+      k: np.array(data[v], copy=True) if k in mutated_inputs else data[v] \
+        for k, v in step_config["Inputs"].items()
+    }
+    kwargs["input_ranges"] = {k: ranges[v] for k, v in step_config["Inputs"].items() if v in (ranges or {})}
+  if "Options" in step_config:
+    kwargs["options"] = {
+      id: data[val] if isinstance(val, str) and val in reads else val \
+        for id, val in step_config["Options"].items()
+    }
+  return kwargs
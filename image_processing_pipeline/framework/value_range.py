@@ -0,0 +1,23 @@
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class ValueRange:
+  """
+  Bounds of the values of an array, known without scanning it.
+
+  Steps declare them for their deliverables in `deliverable_ranges`. The
+  pipeline keeps them in the data manager next to the data and passes them to
+  the steps reading it as `input_ranges`. `binary` marks arrays holding no
+  values other than `low` and `high`.
+  """
+  low: float
+  high: float
+  binary: bool = False
+
+  def within(self, low: float, high: float) -> bool:
+    return low <= self.low and self.high <= high
+
+  def union(self, other: "ValueRange") -> "ValueRange":
+    binary = self.binary and other.binary and (self.low, self.high) == (other.low, other.high)
+    return ValueRange(min(self.low, other.low), max(self.high, other.high), binary)
@@ -1,24 +1,33 @@
-import image_processing_pipeline.processes.apply_mask
-import image_processing_pipeline.processes.apply_morphologies
-import image_processing_pipeline.processes.analyse_statistics
-import image_processing_pipeline.processes.arithmetic_stack_operation
-import image_processing_pipeline.processes.combine_offsets
-import image_processing_pipeline.processes.cull_boundary
-import image_processing_pipeline.processes.extract_dimensions
-import image_processing_pipeline.processes.extract_frames
-import image_processing_pipeline.processes.extract_objects
-import image_processing_pipeline.processes.extrapolate
-import image_processing_pipeline.processes.fourier_denoise
-import image_processing_pipeline.processes.generate_edge_mask
-import image_processing_pipeline.processes.geometry_filter_masks
-import image_processing_pipeline.processes.interpolate
-import image_processing_pipeline.processes.invert
-import image_processing_pipeline.processes.load_stack
-import image_processing_pipeline.processes.median_filter
-import image_processing_pipeline.processes.normalise
-import image_processing_pipeline.processes.number_adder
-import image_processing_pipeline.processes.remove_outliers
-import image_processing_pipeline.processes.remove_zero_pixels
-import image_processing_pipeline.processes.shrink_to_content
-import image_processing_pipeline.processes.star_fill
-import image_processing_pipeline.processes.threshold_binarise
\ No newline at end of file
+from image_processing_pipeline.framework.process_step import process_steps
+
+# Built-in steps by module, imported when a pipeline first uses them
+builtin_process_steps = {
+  "AnalyseStatistics": "analyse_statistics",
+  "ApplyMask": "apply_mask",
+  "ApplyMorphologies": "apply_morphologies",
+  "ArithmeticStackOperation": "arithmetic_stack_operation",
+  "CombineOffsets": "combine_offsets",
+  "CullBoundary": "cull_boundary",
+  "ExtractDimensions": "extract_dimensions",
+  "ExtractFrames": "extract_frames",
+  "ExtractObjects": "extract_objects",
+  "Extrapolate": "extrapolate",
+  "FourierDenoise": "fourier_denoise",
+  "GenerateEdgeMask": "generate_edge_mask",
+  "GeometryFilterMasks": "geometry_filter_masks",
+  "Interpolate": "interpolate",
+  "Invert": "invert",
+  "LabelRegions": "label_regions",
+  "LoadStack": "load_stack",
+  "MedianFilter": "median_filter",
+  "Normalise": "normalise",
+  "NumberAdder": "number_adder",
+  "RemoveOutliers": "remove_outliers",
+  "RemoveZeroPixels": "remove_zero_pixels",
+  "ShrinkToContent": "shrink_to_content",
+  "StarFill": "star_fill",
+  "ThresholdBinarise": "threshold_binarise",
+}
+
+for name, module in builtin_process_steps.items():
+  process_steps.register_lazy(name, f"{__name__}.{module}")
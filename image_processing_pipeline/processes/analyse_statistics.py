@@ -1,7 +1,13 @@
+import os
 import numpy as np
 
+from concurrent.futures import ThreadPoolExecutor
+
 from image_processing_pipeline.framework.process_step import process_steps
 from image_processing_pipeline.processes.apply_mask import ApplyMask
+from image_processing_pipeline.processes.quantile_sketch import QuantileSketch
+
+SKETCH_BLOCK_ROWS = 256 # Rows of a frame added to a sketch at once
 
 class AnalyseStatistics(ApplyMask):
   deliverables = {
@@ -9,8 +15,21 @@ class AnalyseStatistics(ApplyMask):
     "mode": list,
   }
 
+  options = {
+    **ApplyMask.options,
+    "workers": (int, 1), # Threads computing frames in parallel, 0 for one per CPU
+    "sketch_error": (float, 0.), # Relative error of approximate statistics from a `QuantileSketch`, 0 for exact ones
+    "pooled": (bool, False), # Statistics of all frames together instead of per frame, requires a `sketch_error`
+  }
+
   # Inherit inputs, and validations from ApplyMask
 
+  def _on_set_options(self):
+    super()._on_set_options()
+    assert self.workers >= 0, "Option 'workers' must be a non-negative integer."
+    assert 0 <= self.sketch_error < 1, "Option 'sketch_error' must be in [0, 1) range."
+    assert self.sketch_error > 0 or not self.pooled, "Option 'pooled' requires a 'sketch_error' above 0."
+
   def _on_verify_deliverables(self):
     self.quantiles = {}
     for key in self.deliverables_actual:
@@ -43,7 +62,12 @@ class AnalyseStatistics(ApplyMask):
     if n == 0:
       raise ValueError("samples must be non-empty")
 
-    x = np.sort(samples)
+    return AnalyseStatistics._sorted_half_sample_mode(np.sort(samples))
+
+  @staticmethod
+  def _sorted_half_sample_mode(x: np.ndarray) -> float:
+    """Half-sample mode of the non-empty, sorted 1D data `x`."""
+    n = len(x)
     while n > 2:
       h = (n + 1) // 2  # half-sample size (ceil)
       widths = x[h - 1:] - x[:n - h + 1]
@@ -64,30 +88,94 @@ class AnalyseStatistics(ApplyMask):
       - std: Standard deviation of intensity per frame.
       - qX: X-th percentile of intensity per frame (e.g., q25 for 25th percentile).
       - mode: Value which maximizes the probability density function of each frame.
+
+    With a `sketch_error`, every frame is summarised in one pass by a `QuantileSketch`
+    instead, without sorting its samples. Every masked pixel then counts with its mask
+    weight, and quantiles are within the relative error `sketch_error` of the exact
+    ones (exact for integer stacks of up to 16 bits), see `QuantileSketch`. `pooled`
+    merges the sketches of all frames, delivering one value of each statistic.
     """
     if self.mode == "common_footprint":
       combined_mask = np.any(self.mask_stack > 1, axis=0)
       self._get_mask_at_frame = lambda _frame_idx: combined_mask # Override to always return the combined mask
+    else:
+      # Masks have always been interpolated here: the `mode` deliverable used to replace
+      # the option before the masks were read. Kept so results stay reproducible.
+      self.mode = "interpolate"
+
+    n_frames = self.input_stack.shape[0]
+    workers = min(self.workers or os.cpu_count() or 1, n_frames)
+    if self.sketch_error == 0:
+      frames = self._map(self._frame_statistics, range(n_frames), workers)
+    else:
+      if self.pooled: # A sketch per worker, merged
+        bounds = np.linspace(0, n_frames, workers + 1).astype(int)
+        sketches = self._map(self._sketch, [range(a, b) for a, b in zip(bounds[:-1], bounds[1:])], workers)
+        for sketch in sketches[1:]:
+          sketches[0].merge(sketch)
+        sketches = sketches[:1]
+      else:
+        sketches = self._map(self._sketch, [range(i, i + 1) for i in range(n_frames)], workers)
+      frames = [self._sketch_statistics(sketch) for sketch in sketches]
+
+    self.mean, self.std, self.weight, self.mode = ([f[n] for f in frames] for n in range(4))
+    for n, quantile in enumerate(self.quantiles):
+      setattr(self, f"q{quantile}", [f[4][n] for f in frames])
 
-    self.mean, self.std, self.weight, self.mode = [], [], [], []
-    for i in range(self.input_stack.shape[0]):
+  @staticmethod
+  def _map(function, items, workers: int) -> list:
+    if workers <= 1:
+      return [function(item) for item in items]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="statistics") as pool:
+      return list(pool.map(function, items))
+
+  def _sketch(self, frames: range) -> QuantileSketch:
+    """Sketch of the masked pixels of `frames`, weighted by the mask."""
+    sketch = QuantileSketch(self.sketch_error, self.input_stack.dtype)
+    for i in frames:
       mask = self._get_mask_at_frame(i)
-      norm = np.sum(mask)
-      self.weight.append(float(norm))
-
-      samples = np.asarray(self.input_stack[i][mask == 1]).flatten()
-      self.mean.append(float(np.sum(samples) / norm))
-      self.std.append(float(np.sqrt(np.sum((samples - self.mean[-1])**2) / norm)))
-
-      for quantile in self.quantiles:
-        self.quantiles[quantile].append(float(np.percentile(
-          self.input_stack[i], quantile, weights=mask, method="inverted_cdf"
-        )))
+      for row in range(0, mask.shape[0], SKETCH_BLOCK_ROWS):
+        weights = mask[row:row + SKETCH_BLOCK_ROWS]
+        selected = weights > 0
+        sketch.add(self.input_stack[i, row:row + SKETCH_BLOCK_ROWS][selected], weights[selected])
+    return sketch
 
-      self.mode.append(float(self.half_sample_mode(samples)))
+  def _sketch_statistics(self, sketch: QuantileSketch) -> tuple[float, float, float, float, list[float]]:
+    quantiles = sketch.quantiles([quantile / 100 for quantile in self.quantiles]) if self.quantiles else []
+    return sketch.mean, sketch.std, sketch.weight, sketch.half_sample_mode(), quantiles
 
-    for quantile, values in self.quantiles.items():
-      setattr(self, f"q{quantile}", values)
+  def _frame_statistics(self, i: int) -> tuple[float, float, float, float, list[float]]:
+    """
+    Mean, std, weight, mode and quantiles of frame `i`.
 
+    The masked samples are sorted once for the quantiles and the mode. Masks
+    with weights other than 0 and 1 (interpolated) and frames holding NaN
+    fall back to `np.percentile`, sorting the whole frame once for all quantiles.
+    """
+    frame = self.input_stack[i]
+    mask = self._get_mask_at_frame(i)
+    norm = np.sum(mask)
+
+    samples = np.asarray(frame[mask == 1]).flatten()
+    mean = float(np.sum(samples) / norm)
+    std = float(np.sqrt(np.sum((samples - mean)**2) / norm))
+    ordered = np.sort(samples)
+
+    quantiles = []
+    if self.quantiles:
+      binary = mask.dtype == bool or bool(np.all((mask == 0) | (mask == 1)))
+      has_nan = frame.dtype.kind == "f" and bool(np.isnan(frame).any())
+      if binary and not has_nan and len(ordered) > 0:
+        # Inverted CDF of equally weighted samples, as `np.percentile` computes it
+        cdf = np.arange(1, len(ordered) + 1, dtype=np.float64) / len(ordered)
+        q = np.array(list(self.quantiles), dtype=np.float64) / 100
+        values = ordered[np.minimum(np.searchsorted(cdf, q, side="left"), len(ordered) - 1)]
+      else:
+        values = np.percentile(frame, list(self.quantiles), weights=mask, method="inverted_cdf")
+      quantiles = [float(v) for v in values]
+
+    if len(ordered) == 0:
+      raise ValueError("samples must be non-empty")
+    return mean, std, float(norm), float(self._sorted_half_sample_mode(ordered)), quantiles
 
 process_steps["AnalyseStatistics"] = AnalyseStatistics
\ No newline at end of file
@@ -2,12 +2,16 @@ import numpy as np
 
 from image_processing_pipeline.framework.process_step import AbstractProcessStep, process_steps
 
+MASK_BLOCK_BYTES = 1024**2 # Size of the interpolated masks computed at once, about a cache
+
 class ApplyMask(AbstractProcessStep):
   inputs = {"input_stack": np.ndarray, "mask_stack": np.ndarray,}
   deliverables = {"masked_stack": np.ndarray,}
 
   options = {"mode": (str, "interpolate")}
 
+  _cached_mask = None # (lower, upper, weight_upper), mask: of the last frame, shared by consecutive frames
+
   def _on_set_inputs(self):
     assert self.input_stack.shape[0] >= self.mask_stack.shape[0], (
       "Input stack must have equal or greater depth than mask stack."
@@ -21,7 +25,8 @@ class ApplyMask(AbstractProcessStep):
       raise ValueError(f"Unknown mode '{self.mode}'. Supported: interpolate, common_footprint, previous, next")
   
   def _get_mask_at_frame(self, frame_idx: int):
-    mask_idx = frame_idx * (self.mask_stack.shape[0] - 1) / (self.input_stack.shape[0] - 1)
+    """The mask of frame `frame_idx`, read-only, as it may be shared with the frames next to it."""
+    mask_idx = frame_idx * (self.mask_stack.shape[0] - 1) / max(self.input_stack.shape[0] - 1, 1)
     lower_idx = int(np.floor(mask_idx))
     upper_idx = int(np.ceil(mask_idx))
     if self.mode == "previous":
@@ -32,7 +37,17 @@ class ApplyMask(AbstractProcessStep):
       weight_upper = mask_idx - lower_idx
     weight_lower = 1 - weight_upper
 
-    return weight_lower * self.mask_stack[lower_idx] + weight_upper * self.mask_stack[upper_idx]
+    key = (lower_idx, upper_idx, weight_upper)
+    cached = self._cached_mask
+    if cached is not None and cached[0] == key:
+      return cached[1]
+    lower, upper = self.mask_stack[lower_idx], self.mask_stack[upper_idx]
+    if self.float_dtype is not None:
+      lower, upper = lower.astype(self.float_dtype), upper.astype(self.float_dtype)
+    mask = weight_lower * lower + weight_upper * upper
+    mask.flags.writeable = False
+    self._cached_mask = (key, mask)
+    return mask
 
   def _execute(self):
     """
@@ -45,16 +60,54 @@ class ApplyMask(AbstractProcessStep):
       - common_footprint: Crop to the common footprint of the entire mask stack.
       - previous: Use the previous mask frame for each input frame.
       - next: Use the next mask frame for each input frame.
+
+    Masks are interpolated in `float_dtype`, if set, which is also the dtype
+    of the result for float inputs. Integer inputs keep their dtype.
+
+    Consecutive frames between the same two mask frames are masked together,
+    with one mask for all of them in previous/next mode (as bool if it holds
+    only 0 and 1), and masks interpolated in blocks of frames otherwise.
     """
     if self.mode == "common_footprint":
       # Find common footprint
       combined_mask = np.any(self.mask_stack > 1, axis=0)
       self.masked_stack = self.input_stack[:, combined_mask]
     else:
-      self.masked_stack = np.empty_like(self.input_stack)
-      for i in range(self.input_stack.shape[0]):
-        mask = self._get_mask_at_frame(i)
-        self.masked_stack[i,:,:] = self.input_stack[i,:,:] * mask
+      dtype = self.input_stack.dtype
+      if self.float_dtype is not None and dtype.kind == "f":
+        dtype = self.float_dtype
+      self.masked_stack = self._empty(self.input_stack.shape, dtype)
+      n_frames, n_masks = self.input_stack.shape[0], self.mask_stack.shape[0]
+      positions = np.arange(n_frames) * (n_masks - 1) / max(n_frames - 1, 1) # As in `_get_mask_at_frame`
+      lower, upper = np.floor(positions).astype(int), np.ceil(positions).astype(int)
+      bounds = [0, *(np.flatnonzero(np.diff(lower) | np.diff(upper)) + 1), n_frames]
+      block = max(1, MASK_BLOCK_BYTES // max(1, 8 * self.mask_stack[0].size))
+
+      for start, stop in zip(bounds[:-1], bounds[1:]):
+        if self.mode in {"previous", "next"}:
+          mask = self._get_mask_at_frame(start)
+          if mask.dtype != bool and np.all((mask == 0) | (mask == 1)):
+            mask = mask != 0 # Multiplying by bool gives the same values, with less memory traffic
+          self._multiply(slice(start, stop), mask)
+          continue
+
+        mask_lower, mask_upper = self.mask_stack[lower[start]], self.mask_stack[upper[start]]
+        if self.float_dtype is not None:
+          mask_lower, mask_upper = mask_lower.astype(self.float_dtype), mask_upper.astype(self.float_dtype)
+        # Dtype a scalar weight times the mask has, as in `_get_mask_at_frame`
+        weight_dtype = np.result_type(mask_lower.dtype, 1.0)
+        for first in range(start, stop, block):
+          frames = slice(first, min(first + block, stop))
+          weight_upper = (positions[frames] - lower[frames])[:, None, None]
+          weight_lower = 1 - weight_upper
+          weight_lower, weight_upper = weight_lower.astype(weight_dtype), weight_upper.astype(weight_dtype)
+          mask = weight_lower * mask_lower
+          mask += weight_upper * mask_upper
+          self._multiply(frames, mask)
+
+  def _multiply(self, frames: slice, mask: np.ndarray):
+    """Write the input `frames` times `mask` (broadcast over the frames) into the masked stack."""
+    np.multiply(self.input_stack[frames], mask, out=self.masked_stack[frames], casting="unsafe")
 
 
 process_steps["ApplyMask"] = ApplyMask
\ No newline at end of file
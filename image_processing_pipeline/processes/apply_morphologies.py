@@ -6,6 +6,7 @@ from image_processing_pipeline.framework.process_step import AbstractProcessStep
 class ApplyMorphologies(AbstractProcessStep):
   inputs = {"input_stack": np.ndarray}
   deliverables = {"morphed_stack": np.ndarray,}
+  frame_local = True
 
   options = {
     "strategy": (dict, {"binary_erosion": {"iterations": 1}})
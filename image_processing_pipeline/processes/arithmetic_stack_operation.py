@@ -5,6 +5,8 @@ from image_processing_pipeline.framework.process_step import AbstractProcessStep
 class ArithmeticStackOperation(AbstractProcessStep):
   inputs = {"stack_a": np.ndarray, "stack_b": np.ndarray}
   deliverables = {"result_stack": np.ndarray,}
+  frame_local = True
+  elementwise = True
 
   options = {"operation": (str, "")}
   
@@ -17,14 +19,16 @@ class ArithmeticStackOperation(AbstractProcessStep):
   def _execute(self):
     """
     Apply arithmetic operation between two stacks.
+
+    Float results (always for "divide") are computed in `float_dtype`, if set.
     """
-    if self.operation == "add":
-      self.result_stack = self.stack_a + self.stack_b
-    elif self.operation == "subtract":
-      self.result_stack = self.stack_a - self.stack_b
-    elif self.operation == "multiply":
-      self.result_stack = self.stack_a * self.stack_b
-    elif self.operation == "divide":
-      self.result_stack = self.stack_a / self.stack_b
+    ufunc = {"add": np.add, "subtract": np.subtract, "multiply": np.multiply, "divide": np.divide}[self.operation]
+    dtype = None
+    if self.float_dtype is not None and (
+      self.operation == "divide" or np.result_type(self.stack_a, self.stack_b).kind == "f"
+    ):
+      dtype = self.float_dtype
+    out_dtype = dtype or ufunc.resolve_dtypes((self.stack_a.dtype, self.stack_b.dtype, None))[-1]
+    self.result_stack = ufunc(self.stack_a, self.stack_b, dtype=dtype, out=self._empty(self.stack_a.shape, out_dtype))
 
 process_steps["ArithmeticStackOperation"] = ArithmeticStackOperation
\ No newline at end of file
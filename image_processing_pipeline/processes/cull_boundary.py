@@ -5,6 +5,7 @@ from image_processing_pipeline.framework.process_step import AbstractProcessStep
 class CullBoundary(AbstractProcessStep):
   inputs = {"input_stack": np.ndarray,}
   deliverables = {"culled_stack": np.ndarray,"former_image_shape": tuple, "culled_image_offset": tuple}
+  frame_local = True
 
   options = {
     "top": ((int, float), 0),
@@ -82,10 +83,13 @@ class CullBoundary(AbstractProcessStep):
     Assume input is normalised to [0,1]. For this every pixel value below the threshold
     is set to 0, every pixel value above or equal to the threshold is set to 1.
     """
-    top, bottom = self.top, self.bottom
-    left, right = self.left, self.right
-
-    self.culled_stack = self.input_stack[:,top:-bottom,left:-right]
-    self.culled_image_offset = (top, left)
+    rows, cols = self._crop_slices()
+    self.culled_stack = self.input_stack[:, rows, cols]
+    self.culled_image_offset = (self.top, self.left)
+
+  def _crop_slices(self) -> tuple[slice, slice]:
+    """Row and column slices of the region kept, also for zero `bottom` or `right` margins."""
+    height, width = self.former_image_shape[:2]
+    return slice(self.top, height - self.bottom), slice(self.left, width - self.right)
 
 process_steps["CullBoundary"] = CullBoundary
\ No newline at end of file
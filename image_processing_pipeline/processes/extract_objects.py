@@ -2,11 +2,19 @@ import numpy as np
 import scipy.ndimage as nd
 
 from image_processing_pipeline.framework.process_step import AbstractProcessStep, process_steps
+from image_processing_pipeline.framework.region_table import RegionTable
 
 class ExtractObjects(AbstractProcessStep):
-  inputs = {"input_stack": np.ndarray}
+  inputs = {
+    "input_stack": np.ndarray,
+    "region_table": (RegionTable | None, None), # Regions of the input stack labelled across frames, from LabelRegions
+  }
   deliverables = {r"object_stack_\d+": np.ndarray, r"offset_\d+": tuple}
 
+  def _on_set_inputs(self):
+    assert self.region_table is None or not self.region_table.per_frame, \
+      "Input 'region_table' must hold regions labelled across frames (LabelRegions 'per_frame' false)."
+
   def _on_verify_deliverables(self):
     self.stacks  = sorted({k for k in self.deliverables_actual if "stack" in k})
     self.offsets = sorted({k for k in self.deliverables_actual if "offset" in k})
@@ -23,13 +31,18 @@ class ExtractObjects(AbstractProcessStep):
     Extracts a variable, but at execution time constant, number of objects from the stack.
 
     Currently individual objects must be separated from one another by 0 pixels, but have
-    to have a pixel overlap amongs the stack direction.
+    to have a pixel overlap amongs the stack direction. Given the `region_table` of
+    LabelRegions, the objects are taken from it instead of labelling the stack again.
     """
-    labelled, n_labels = nd.label(self.input_stack)
+    if self.region_table is not None:
+      n_labels = len(self.region_table)
+      ranges = [self.region_table.slices(row) for row in range(n_labels)]
+    else:
+      labelled, n_labels = nd.label(self.input_stack)
+      ranges = nd.find_objects(labelled)
     n_expected = len(self.deliverables_actual) // 2
     assert n_labels == n_expected, \
       f"Mismatch between objects found ({n_labels}) and expected number ({n_expected})"
-    ranges = nd.find_objects(labelled)
 
     for n, (stack, offset) in enumerate(zip(self.stacks, self.offsets)):
       setattr(self, stack, self.input_stack[:, ranges[n][1], ranges[n][2]])
@@ -5,6 +5,7 @@ from image_processing_pipeline.framework.process_step import AbstractProcessStep
 class Extrapolate(AbstractProcessStep):
   inputs = {"input_stack": np.ndarray,}
   deliverables = {"extrapolated_stack": np.ndarray, "extrapolated_frames": list}
+  mutated_inputs = {"input_stack"}
 
   def _execute(self):
     """
@@ -13,8 +13,14 @@ class FourierDenoise(AbstractProcessStep):
 
   def _execute(self):
     """
+    Removes frequencies weaker than `denoise_level` times the strongest one.
+
+    The transform is computed in `float_dtype` (complex64 for float32), if set.
     """
-    ft = np.fft.fft2(self.input_stack)
+    stack = self.input_stack
+    if self.float_dtype is not None:
+      stack = stack.astype(self.float_dtype, copy=False)
+    ft = np.fft.fft2(stack)
     ft[np.abs(ft) < self.denoise_level * np.max(np.abs(ft))] = 0
     self.denoised_stack = np.abs(np.fft.ifft2(ft))
 
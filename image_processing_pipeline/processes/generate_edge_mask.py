@@ -6,6 +6,7 @@ from image_processing_pipeline.framework.process_step import AbstractProcessStep
 class GenerateEdgeMask(AbstractProcessStep):
   inputs = {"input_stack": np.ndarray,}
   deliverables = {"edge_mask": np.ndarray,}
+  frame_local = True
 
   options = {"sigma": (float, 25.)}
 
@@ -19,7 +20,8 @@ class GenerateEdgeMask(AbstractProcessStep):
     The masks contains True where an edge is detected, False otherwise.
     Parameter sigma defines the kernel width used for the Gaussian Laplace filter.
     """
-    res = nd.gaussian_laplace(self.input_stack, self.sigma, axes=(1,2))
+    output = self.float_dtype if self.float_dtype is not None and self.input_stack.dtype.kind == "f" else None
+    res = nd.gaussian_laplace(self.input_stack, self.sigma, axes=(1,2), output=output)
     self.edge_mask = res < 0
 
 process_steps["GenerateEdgeMask"] = GenerateEdgeMask
\ No newline at end of file
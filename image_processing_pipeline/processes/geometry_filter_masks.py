@@ -1,11 +1,20 @@
+import os
 import numpy as np
 import scipy.ndimage as nd
 
+from concurrent.futures import ThreadPoolExecutor
+
 from image_processing_pipeline.framework.process_step import AbstractProcessStep, process_steps
+from image_processing_pipeline.framework.region_table import RegionTable
 
 class GeometryFilterMasks(AbstractProcessStep):
-  inputs = {"input_stack": np.ndarray,}
+  inputs = {
+    "input_stack": np.ndarray,
+    "labelled_stack": (np.ndarray | None, None), # Labels of the input stack per frame, from LabelRegions
+    "region_table": (RegionTable | None, None), # Regions of `labelled_stack`, from LabelRegions
+  }
   deliverables = {"filtered_mask_stack": np.ndarray,}
+  frame_local = True
 
   options = {
     "min_aspect_dx_dy": (float, 0.),
@@ -16,8 +25,18 @@ class GeometryFilterMasks(AbstractProcessStep):
     "max_size_dx": (float, np.inf),
     "min_size_dy": (float, 0.),
     "max_size_dy": (float, np.inf),
+    "workers": (int, 1), # Threads filtering frames in parallel, 0 for one per CPU
   }
 
+  def _on_set_inputs(self):
+    assert (self.labelled_stack is None) == (self.region_table is None), \
+      "Inputs 'labelled_stack' and 'region_table' must be given together."
+    assert self.region_table is None or self.region_table.per_frame, \
+      "Input 'region_table' must hold regions labelled per frame."
+
+  def _on_set_options(self):
+    assert self.workers >= 0, "Option 'workers' must be a non-negative integer."
+
   def _execute(self):
     """
     Applies geometric filtering to connected components in the input binary mask stack.
@@ -26,21 +45,48 @@ class GeometryFilterMasks(AbstractProcessStep):
     - Aspect Ratio: The ratio of width to height (dx/dy) and height to width (dy/dx) must be above specified minimums.
     - Area: The area (width * height) must be within specified minimum and maximum bounds.
     - Size: The width (dx) and height (dy) must be within specified minimum and maximum bounds.
+
+    All components are measured at once from their bounding boxes (`find_objects`),
+    and the rejected ones are zeroed through a lookup table of their labels. Given the
+    `labelled_stack` and `region_table` of LabelRegions, the components are taken from
+    them instead of labelling the input stack again.
     """
-    for n in range(self.input_stack.shape[0]):
-      labelled, _ = nd.label(self.input_stack[n,:,:])
-      for indices in nd.value_indices(labelled).values():
-        dX = np.max(indices[0]) - np.min(indices[0])
-        dY = np.max(indices[1]) - np.min(indices[1])
-        area = dX*dY
-        if area < self.min_area or area > self.max_area:
-          self.input_stack[n,*indices] = 0
-          continue
-        if dX < self.min_size_dx or dX > self.max_size_dx or dY < self.min_size_dy or dY > self.max_size_dy:
-          self.input_stack[n,*indices] = 0
-          continue
-        if dX / (dY + 1e-6) < self.min_aspect_dx_dy or dY / (dX + 1e-6) < self.min_aspect_dy_dx:
-          self.input_stack[n,*indices] = 0
-    self.filtered_mask_stack = self.input_stack
+    if self.region_table is not None:
+      table = self.region_table
+      self._rejected_labels = table.lookup(self._rejected(table.x0, table.x1, table.y0, table.y1), False)
+    self.filtered_mask_stack = self._empty(self.input_stack.shape, self.input_stack.dtype)
+    n_frames = self.input_stack.shape[0]
+    workers = min(self.workers or os.cpu_count() or 1, n_frames)
+    if workers <= 1:
+      for n in range(n_frames):
+        self._filter_frame(n)
+    else:
+      with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="geometry_filter") as pool:
+        list(pool.map(self._filter_frame, range(n_frames)))
+
+  def _filter_frame(self, n: int):
+    output = self.filtered_mask_stack[n,:,:]
+    output[...] = self.input_stack[n,:,:]
+    if self.region_table is not None:
+      output[self._rejected_labels[self.labelled_stack[n,:,:]]] = 0
+      return
+
+    labelled, count = nd.label(self.input_stack[n,:,:])
+    if count == 0:
+      return
+    # Extents of the components, along the first (X) and second (Y) axis
+    bounds = np.array([(x.start, x.stop, y.start, y.stop) for x, y in nd.find_objects(labelled)])
+    rejected = self._rejected(bounds[:, 0], bounds[:, 1], bounds[:, 2], bounds[:, 3])
+    if rejected.any():
+      output[np.concatenate(([False], rejected))[labelled]] = 0
+
+  def _rejected(self, x0: np.ndarray, x1: np.ndarray, y0: np.ndarray, y1: np.ndarray) -> np.ndarray:
+    """Whether components of the bounding boxes [x0, x1) x [y0, y1) fail any criterion."""
+    dX = x1 - 1 - x0
+    dY = y1 - 1 - y0
+    area = dX*dY
+    return (area < self.min_area) | (area > self.max_area) \
+      | (dX < self.min_size_dx) | (dX > self.max_size_dx) | (dY < self.min_size_dy) | (dY > self.max_size_dy) \
+      | (dX / (dY + 1e-6) < self.min_aspect_dx_dy) | (dY / (dX + 1e-6) < self.min_aspect_dy_dx)
 
 process_steps["GeometryFilterMasks"] = GeometryFilterMasks
\ No newline at end of file
@@ -1,10 +1,12 @@
 import numpy as np
 
 from image_processing_pipeline.framework.process_step import AbstractProcessStep, process_steps
+from image_processing_pipeline.framework.value_range import ValueRange
 
 class Interpolate(AbstractProcessStep):
   inputs = {"input_stack": np.ndarray,}
   deliverables = {"interpolated_stack": np.ndarray, "interpolated_frames": list}
+  mutated_inputs = {"input_stack"}
 
   options = {'mode': (str, "common_footprint")}
 
@@ -13,7 +15,7 @@ class Interpolate(AbstractProcessStep):
       raise ValueError(f"Unknown mode '{self.mode}'. Supported: interpolate, common_footprint, previous, next")
     
     if self.mode == "common_footprint":
-      assert np.isin(1.0 * self.input_stack, [0., 1.]).all(), \
+      assert self._is_binary("input_stack"), \
         "Mode 'common_footprint' requires input_stack to have only 0 & 1 or binary values."
   
 
@@ -63,11 +65,17 @@ class Interpolate(AbstractProcessStep):
     # Interpolate
     self.interpolated_stack = self.input_stack
     if self.mode == "interpolate" and np.any(self.interpolated_frames):
-      self.interpolated_stack = self.interpolated_stack.astype("float32")
+      self.interpolated_stack = self.interpolated_stack.astype(self.float_dtype or "float32")
     for s, e in zip(starts, ends):
       for i in range(s, e + 1):
         self.interpolate(i, s, e)
     self.interpolated_frames = self.interpolated_frames.tolist() # To support serialisation
 
+    # Interpolated frames lie in the range of the frames they are computed from
+    known = self.input_ranges.get("input_stack")
+    if known is not None:
+      binary = known.binary and (self.mode != "interpolate" or not any(self.interpolated_frames))
+      self.deliverable_ranges["interpolated_stack"] = ValueRange(known.low, known.high, binary)
+
 
 process_steps["Interpolate"] = Interpolate
\ No newline at end of file
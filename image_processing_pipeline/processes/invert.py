@@ -1,20 +1,30 @@
 import numpy as np
 
 from image_processing_pipeline.framework.process_step import AbstractProcessStep, process_steps
+from image_processing_pipeline.framework.value_range import ValueRange
 
 class Invert(AbstractProcessStep):
   inputs = {"input_stack": np.ndarray,}
   deliverables = {"inverted_stack": np.ndarray,}
+  frame_local = True
+  elementwise = True
 
   def _on_set_inputs(self):
-    assert np.all((self.input_stack >= 0) & (self.input_stack <= 1)), "Input stack must be in [0, 1] range."
+    assert self._values_within("input_stack", 0, 1), "Input stack must be in [0, 1] range."
 
   def _execute(self):
     """
     Inverts the image stack.
 
     Assumes input is normalised to [0, 1]. Then the image is inverted by calculating 1 - image.
+    Float results are computed in `float_dtype`, if set.
     """
-    self.inverted_stack = 1 - self.input_stack
+    dtype = self.float_dtype if self.input_stack.dtype.kind == "f" else None
+    out = self._empty(self.input_stack.shape, dtype or np.result_type(1, self.input_stack))
+    self.inverted_stack = np.subtract(1, self.input_stack, dtype=dtype, out=out)
+    known = self.input_ranges.get("input_stack")
+    if known is None or not known.within(0, 1):
+      known = ValueRange(0, 1) # Validated on input
+    self.deliverable_ranges["inverted_stack"] = ValueRange(1 - known.high, 1 - known.low, known.binary)
 
 process_steps["Invert"] = Invert
\ No newline at end of file
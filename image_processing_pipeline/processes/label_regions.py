@@ -0,0 +1,54 @@
+import os
+import numpy as np
+import scipy.ndimage as nd
+
+from concurrent.futures import ThreadPoolExecutor
+
+from image_processing_pipeline.framework.process_step import AbstractProcessStep, process_steps
+from image_processing_pipeline.framework.region_table import RegionTable
+from image_processing_pipeline.framework.value_range import ValueRange
+
+class LabelRegions(AbstractProcessStep):
+  inputs = {"input_stack": np.ndarray,}
+  deliverables = {"labelled_stack": np.ndarray, "region_table": RegionTable,}
+
+  options = {
+    "per_frame": (bool, True), # Label every frame on its own (as GeometryFilterMasks), false labels across frames (as ExtractObjects)
+    "workers": (int, 1), # Threads labelling frames in parallel, 0 for one per CPU
+  }
+
+  def _on_set_options(self):
+    assert self.workers >= 0, "Option 'workers' must be a non-negative integer."
+
+  def _execute(self):
+    """
+    Labels the connected regions of non-zero pixels in the input stack and tabulates them.
+
+    Labels run from 1 to the number of regions over the whole stack, frame by frame
+    when labelling per frame, so every region has a label of its own. The region
+    table (see `RegionTable`) holds their bounding boxes, pixel counts and centroids,
+    letting later steps (GeometryFilterMasks, ExtractObjects) use the regions
+    without labelling the stack again.
+    """
+    self.labelled_stack = self._empty(self.input_stack.shape, np.int32)
+    if not self.per_frame:
+      nd.label(self.input_stack, output=self.labelled_stack)
+    else:
+      n_frames = self.input_stack.shape[0]
+      workers = min(self.workers or os.cpu_count() or 1, n_frames)
+      label = lambda n: nd.label(self.input_stack[n], output=self.labelled_stack[n])
+      if workers <= 1:
+        counts = [label(n) for n in range(n_frames)]
+      else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="label_regions") as pool:
+          counts = list(pool.map(label, range(n_frames)))
+      # Continue the labels of every frame after those of the frames before
+      for n, offset in enumerate(np.cumsum([0] + counts[:-1])):
+        if offset > 0 and counts[n] > 0:
+          frame = self.labelled_stack[n]
+          np.add(frame, offset, out=frame, where=frame > 0)
+
+    self.region_table = RegionTable.from_labels(self.labelled_stack, self.per_frame)
+    self.deliverable_ranges["labelled_stack"] = ValueRange(0, len(self.region_table))
+
+process_steps["LabelRegions"] = LabelRegions
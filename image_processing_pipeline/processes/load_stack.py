@@ -1,7 +1,10 @@
+import math, os, sys
 import numpy as np
 import tifffile as tiff
 
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Union
 
 from image_processing_pipeline.framework.process_step import process_steps
 from image_processing_pipeline.processes.cull_boundary import CullBoundary
@@ -11,25 +14,92 @@ class LoadStack(CullBoundary): # Inherit from CullBoundary to reuse its options
   deliverables = {"loaded_stack": np.ndarray,"former_image_shape": tuple, "culled_image_offset": tuple}
 
   # Options and option verification inherited from CullBoundary
+  options = {
+    **CullBoundary.options,
+    "memory_map": (bool, True), # Map uncompressed, contiguous files instead of reading them
+    "decode_workers": (int, 1), # Threads decoding pages in parallel, 0 for one per CPU
+  }
+
+  def _on_set_options(self):
+    super()._on_set_options()
+    assert self.decode_workers >= 0, "Option 'decode_workers' must be a non-negative integer."
 
   def _on_set_inputs(self):
     with tiff.TiffFile(self.input_path) as tif:
       assert len(tif.series) == 1, f"Can only load tif files with a single series, got {tif.series} instead."
       self.former_image_shape = tif.pages[0].shape
+      self.n_frames = len(tif.pages)
+
+  def frame_count(self) -> int:
+    return self.n_frames
 
   def _execute(self):
     """
     Load a stack from a multipage tiff file.
+
+    Uncompressed files with contiguous image data in native byte order are
+    memory mapped, delivering a read-only view of the cropped region, which is
+    only read from disk when accessed. Other files are decoded page by page
+    into one preallocated array, using `decode_workers` threads.
     """
-    top, bottom = self.top, self.bottom
-    left, right = self.left, self.right
+    rows, cols = self._crop_slices()
+    frames = self.frame_range or slice(None)
 
     with tiff.TiffFile(self.input_path) as tif:
-      self.loaded_stack = np.array([
-        page.asarray()[top:-bottom, left:-right] for page in tif.pages
-      ], dtype=tif.pages[0].dtype)
+      mapped = self._memory_map(tif) if self.memory_map else None
+      if mapped is not None:
+        self.loaded_stack = mapped[frames, rows, cols].view(np.ndarray)
+      else:
+        workers = self.decode_workers or os.cpu_count() or 1
+        self.loaded_stack = self._decode_pages(tif, range(self.n_frames)[frames], rows, cols, workers)
+
+    self.culled_image_offset = (self.top, self.left)
+
+  def _memory_map(self, tif: tiff.TiffFile) -> Union[np.memmap, None]:
+    """Read-only map of the whole stack, None if the file layout does not permit it."""
+    series = tif.series[0]
+    shape = (self.n_frames,) + tuple(self.former_image_shape)
+    native_order = "<" if sys.byteorder == "little" else ">"
+    if series.dataoffset is None or tif.byteorder != native_order or math.prod(series.shape) != math.prod(shape):
+      return None
+    return np.memmap(self.input_path, dtype=series.dtype, mode="r", offset=series.dataoffset, shape=shape)
+
+  @staticmethod
+  def _decode_pages(tif: tiff.TiffFile, indices: range, rows: slice, cols: slice, workers: int) -> np.ndarray:
+    """
+    Decode the pages `indices` cropped to `rows` and `cols`, into one array.
+
+    Pages are split into contiguous blocks, one per worker thread. File reads
+    are serialised by tifffile's file handle lock, decompression runs in parallel.
+    """
+    first = tif.pages[0]
+    height, width = first.shape[:2]
+    cropped_shape = (len(range(height)[rows]), len(range(width)[cols])) + first.shape[2:]
+    stack = np.empty((len(indices),) + cropped_shape, dtype=first.dtype)
+    pages = [tif.pages[idx] for idx in indices] # Parse the page headers up front, which is not thread-safe
+
+    def decode(block: range):
+      page_buffer = None
+      for n in block:
+        if cropped_shape == first.shape: # Uncropped, decode in place
+          pages[n].asarray(out=stack[n], maxworkers=1)
+          continue
+        if page_buffer is None:
+          page_buffer = np.empty(first.shape, dtype=first.dtype)
+        pages[n].asarray(out=page_buffer, maxworkers=1)
+        stack[n] = page_buffer[rows, cols]
+
+    workers = min(workers, len(pages))
+    if workers <= 1:
+      decode(range(len(pages)))
+      return stack
+
+    tif.filehandle.lock = True
+    bounds = np.linspace(0, len(pages), workers + 1).astype(int)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tiff_decode") as pool:
+      for future in [pool.submit(decode, range(a, b)) for a, b in zip(bounds[:-1], bounds[1:])]:
+        future.result()
+    return stack
 
-    self.culled_image_offset = (top, left)
-      
 
-process_steps["LoadStack"] = LoadStack
\ No newline at end of file
+process_steps["LoadStack"] = LoadStack
@@ -6,6 +6,7 @@ from image_processing_pipeline.framework.process_step import AbstractProcessStep
 class MedianFilter(AbstractProcessStep):
   inputs = {"input_stack": np.ndarray,}
   deliverables = {"filtered_stack": np.ndarray,}
+  frame_local = True
 
   options = {"iterations": (int, 1), "size": (int, 3),}
 
@@ -16,8 +17,12 @@ class MedianFilter(AbstractProcessStep):
     For this the scipy.ndimage.median_filter function is used. The filter is applied
     `iterations` times with a filter size of `size`.
     """
-    self.filtered_stack = np.copy(self.input_stack)
-    for _ in range(self.iterations):
-      self.filtered_stack = median_filter(self.filtered_stack, size=self.size, axes=(1,2))
+    # Iterations alternate between two output arrays
+    outputs = [self._empty(self.input_stack.shape, self.input_stack.dtype) for _ in range(min(self.iterations, 2))]
+    self.filtered_stack = self.input_stack if self.iterations > 0 else np.copy(self.input_stack)
+    for n in range(self.iterations):
+      self.filtered_stack = median_filter(self.filtered_stack, size=self.size, axes=(1,2), output=outputs[n % 2])
+    if self.iterations > 1:
+      self._recycle(outputs[self.iterations % 2])
 
 process_steps["MedianFilter"] = MedianFilter
\ No newline at end of file
@@ -1,17 +1,26 @@
 import numpy as np
 
 from image_processing_pipeline.framework.process_step import AbstractProcessStep, process_steps
+from image_processing_pipeline.framework.value_range import ValueRange
 
 class Normalise(AbstractProcessStep):
   inputs = {"input_stack": np.ndarray,}
   deliverables = {"normalised_stack": np.ndarray,}
+  frame_local = True
 
   def _execute(self):
     """
     Normalises the image stack to [0, 1] range.
+
+    The result is float64, unless a `float_dtype` is set.
     """
     min_vals = self.input_stack.min(axis=(1, 2), keepdims=True)
     max_vals = self.input_stack.max(axis=(1, 2), keepdims=True)
-    self.normalised_stack = (self.input_stack - min_vals) / (max_vals - min_vals + 1e-8)
+    dtype = self.float_dtype or np.result_type(self.input_stack.dtype, 1e-8)
+    self.normalised_stack = np.subtract(
+      self.input_stack, min_vals, dtype=dtype, out=self._empty(self.input_stack.shape, dtype)
+    )
+    self.normalised_stack /= (max_vals - min_vals).astype(dtype) + dtype.type(1e-8)
+    self.deliverable_ranges["normalised_stack"] = ValueRange(0, 1)
 
 process_steps["Normalise"] = Normalise
\ No newline at end of file
@@ -0,0 +1,192 @@
+import math
+import numpy as np
+
+from typing import Union
+
+
+class _Store:
+  """Weights of integer bucket keys, as a dense array starting at key `offset`."""
+
+  def __init__(self):
+    self.offset = 0
+    self.counts = np.zeros(0, np.float64)
+
+  def add(self, keys: np.ndarray, weights: np.ndarray):
+    if keys.size == 0:
+      return
+    low, high = int(keys.min()), int(keys.max())
+    self._extend(low, high)
+    self.counts += np.bincount(keys - self.offset, weights=weights, minlength=self.counts.size)
+
+  def merge(self, other: "_Store"):
+    if other.counts.size == 0:
+      return
+    self._extend(other.offset, other.offset + other.counts.size - 1)
+    start = other.offset - self.offset
+    self.counts[start:start + other.counts.size] += other.counts
+
+  def _extend(self, low: int, high: int):
+    if self.counts.size == 0:
+      self.offset, self.counts = low, np.zeros(high - low + 1, np.float64)
+      return
+    below = max(0, self.offset - low)
+    above = max(0, high - (self.offset + self.counts.size - 1))
+    if below or above:
+      self.counts = np.pad(self.counts, (below, above))
+      self.offset -= below
+
+  def nonzero(self) -> tuple[np.ndarray, np.ndarray]:
+    """Keys with a weight, ascending, and their weights."""
+    keys = np.flatnonzero(self.counts)
+    return keys + self.offset, self.counts[keys]
+
+
+class QuantileSketch:
+  """
+  Mergeable summary of weighted samples, giving quantiles, the half-sample mode,
+  mean and std in memory independent of the number of samples.
+
+  Integer samples of at most 16 bits are counted per value, all results but the
+  std (rounding aside) are then exact. Other samples are counted in logarithmic
+  buckets, as in DDSketch: a sample x > 0 falls into bucket k with
+  gamma^(k-1) < x <= gamma^k, gamma = (1 + relative_error) / (1 - relative_error),
+  negative samples likewise by their magnitude, and is represented by
+  2 gamma^k / (gamma + 1). Error bounds, for samples counted in buckets:
+    - quantiles (inverted CDF, as `np.percentile(..., method="inverted_cdf")`):
+      |estimate - exact| <= relative_error * |exact|,
+    - mode: the half-sample mode of the bucket representatives, within the
+      same relative error of a sample, but not of the exact mode in general,
+    - mean and std: exact (accumulated in float64).
+  Memory grows with the logarithm of the range of the sample magnitudes only,
+  at most about ln(max / min) / (2 relative_error) buckets per sign.
+
+  Samples that are NaN or infinite make all results but the weight NaN.
+  """
+
+  def __init__(self, relative_error: float, dtype):
+    if not 0 < relative_error < 1:
+      raise ValueError(f"relative_error must be in (0, 1), got {relative_error}.")
+    self.relative_error = relative_error
+    self.dtype = np.dtype(dtype)
+    self.exact = self.dtype.kind in "biu" and self.dtype.itemsize <= 2
+    self.gamma = (1 + relative_error) / (1 - relative_error)
+    self._log_gamma = math.log(self.gamma)
+
+    self._positive, self._negative = _Store(), _Store() # Bucket keys, or values if exact
+    self._zero = 0. # Weight of samples too small for a bucket
+    self.weight = 0. # Sum of all weights, including non-finite samples
+    self.finite = True
+    # Weighted mean and sum of squared deviations (Chan et al.), of the finite samples
+    self._weight, self._mean, self._m2 = 0., 0., 0.
+
+  def add(self, samples: np.ndarray, weights: Union[np.ndarray, None] = None):
+    """Add `samples`, weighted by non-negative `weights` (1 each if None)."""
+    samples = np.asarray(samples).ravel()
+    weights = np.ones(samples.size) if weights is None else np.asarray(weights, np.float64).ravel()
+    self.weight += float(weights.sum())
+    if samples.dtype.kind == "f":
+      finite = np.isfinite(samples)
+      if not finite.all():
+        self.finite = False
+        samples, weights = samples[finite], weights[finite]
+    if samples.size == 0:
+      return
+
+    values = samples.astype(np.float64)
+    weight = float(weights.sum())
+    if weight > 0:
+      mean = float(np.dot(weights, values)) / weight
+      m2 = float(np.dot(weights, (values - mean)**2))
+      total = self._weight + weight
+      delta = mean - self._mean
+      self._mean += delta * weight / total
+      self._m2 += m2 + delta**2 * self._weight * weight / total
+      self._weight = total
+
+    if self.exact:
+      self._positive.add(samples.astype(np.int64), weights)
+      return
+    magnitudes = np.abs(values)
+    bucketed = magnitudes >= np.finfo(np.float64).tiny
+    self._zero += float(weights[~bucketed].sum())
+    keys = np.ceil(np.log(magnitudes[bucketed]) / self._log_gamma).astype(np.int64)
+    positive = values[bucketed] > 0
+    self._positive.add(keys[positive], weights[bucketed][positive])
+    self._negative.add(keys[~positive], weights[bucketed][~positive])
+
+  def merge(self, other: "QuantileSketch"):
+    """Add the samples summarised by `other`, a sketch of the same error and kind."""
+    if (other.exact, other.gamma) != (self.exact, self.gamma):
+      raise ValueError("Only sketches of the same relative error and kind can be merged.")
+    self._positive.merge(other._positive)
+    self._negative.merge(other._negative)
+    self._zero += other._zero
+    self.weight += other.weight
+    self.finite = self.finite and other.finite
+    if other._weight > 0:
+      total = self._weight + other._weight
+      delta = other._mean - self._mean
+      self._mean += delta * other._weight / total
+      self._m2 += other._m2 + delta**2 * self._weight * other._weight / total
+      self._weight = total
+
+  def _distribution(self) -> tuple[np.ndarray, np.ndarray]:
+    """Represented values, ascending, and their weights."""
+    keys, weights = self._positive.nonzero()
+    if self.exact:
+      return keys.astype(np.float64), weights
+    representative = lambda k: 2 * self.gamma**k.astype(np.float64) / (self.gamma + 1)
+    negative_keys, negative_weights = self._negative.nonzero()
+    zero = [0.] if self._zero > 0 else []
+    values = np.concatenate((-representative(negative_keys[::-1]), zero, representative(keys)))
+    weights = np.concatenate((negative_weights[::-1], [self._zero] if zero else [], weights))
+    return values, weights
+
+  def _check_samples(self):
+    if self._weight == 0 and self.finite:
+      raise ValueError("samples must be non-empty")
+
+  def quantiles(self, qs: list[float]) -> list[float]:
+    """Quantiles `qs` (in [0, 1]) by the inverted CDF of the weights."""
+    self._check_samples()
+    if not self.finite:
+      return [math.nan] * len(qs)
+    values, weights = self._distribution()
+    cdf = np.cumsum(weights)
+    cdf /= cdf[-1]
+    indices = np.minimum(np.searchsorted(cdf, np.asarray(qs, np.float64), side="left"), len(values) - 1)
+    return [float(v) for v in values[indices]]
+
+  def half_sample_mode(self) -> float:
+    """
+    Half-sample mode, as `AnalyseStatistics.half_sample_mode` on the sorted
+    samples, with every value repeated by its weight.
+    """
+    self._check_samples()
+    if not self.finite:
+      return math.nan
+    values, weights = self._distribution()
+    cumulative = np.cumsum(weights) # Rank r is held by the first value with cumulative weight above r
+    at = lambda ranks: values[np.minimum(np.searchsorted(cumulative, ranks, side="right"), len(values) - 1)]
+    low, n = 0., float(cumulative[-1])
+    while n > 2:
+      h = (n + 1) // 2
+      # Windows of h samples may start at `low` or the first rank of any value up to `low + n - h`.
+      # Starting later within the run of a value never makes a window narrower.
+      first, last = np.searchsorted(cumulative, [low, low + n - h], side="right")
+      starts = np.concatenate(([low], cumulative[first:last]))
+      low = float(starts[np.argmin(at(starts + h - 1) - at(starts))])
+      n = h
+    if n <= 1:
+      return float(at(low))
+    return 0.5 * (float(at(low)) + float(at(low + 1)))
+
+  @property
+  def mean(self) -> float:
+    self._check_samples()
+    return self._mean if self.finite else math.nan
+
+  @property
+  def std(self) -> float:
+    self._check_samples()
+    return math.sqrt(self._m2 / self._weight) if self.finite else math.nan
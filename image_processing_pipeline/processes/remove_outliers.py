@@ -1,10 +1,12 @@
 import numpy as np
 
 from image_processing_pipeline.framework.process_step import AbstractProcessStep, process_steps
+from image_processing_pipeline.framework.value_range import ValueRange
 
 class RemoveOutliers(AbstractProcessStep):
   inputs = {"input_stack": np.ndarray,}
   deliverables = {"filtered_stack": np.ndarray,}
+  frame_local = True
 
   options = {"lower_quantile": (float, 0.0), "upper_quantile": (float, 1.0)}
 
@@ -13,7 +15,7 @@ class RemoveOutliers(AbstractProcessStep):
     Removes outliers from the image stack.
 
     For this every pixel value below or above the quantile specified in the options parameter
-    is set to the respective quantile values.
+    is set to the respective quantile values. The result is float, in `float_dtype` if set.
     """
     # Get quantiles for each slice
     ql = self.lower_quantile
@@ -23,6 +25,9 @@ class RemoveOutliers(AbstractProcessStep):
     # Extract low/high, reshape to broadcast over the input stack height
     low  = qs[0, :, None, None]
     high = qs[1, :, None, None]
-    self.filtered_stack = np.clip(self.input_stack, low, high)
+    out = self._empty(self.input_stack.shape, self.float_dtype or np.result_type(self.input_stack, qs))
+    self.filtered_stack = np.clip(self.input_stack, low, high, dtype=self.float_dtype, out=out)
+    if qs.size > 0:
+      self.deliverable_ranges["filtered_stack"] = ValueRange(float(qs[0].min()), float(qs[1].max()))
 
 process_steps["RemoveOutliers"] = RemoveOutliers
\ No newline at end of file
@@ -23,7 +23,9 @@ class RemoveZeroPixels(AbstractProcessStep):
       replace_by = np.min(self.input_stack[self.input_stack > 0])
     elif self.replace_by == "max":
       replace_by = np.max(self.input_stack)
-    
-    self.corrected_stack = np.where(self.input_stack == 0, replace_by, self.input_stack)
+
+    self.corrected_stack = self._empty(self.input_stack.shape, np.result_type(replace_by, self.input_stack))
+    np.copyto(self.corrected_stack, self.input_stack)
+    np.copyto(self.corrected_stack, replace_by, where=self.input_stack == 0)
 
 process_steps["RemoveZeroPixels"] = RemoveZeroPixels
\ No newline at end of file
@@ -1,10 +1,12 @@
 import numpy as np
 
 from image_processing_pipeline.framework.process_step import AbstractProcessStep, process_steps
+from image_processing_pipeline.framework.value_range import ValueRange
 
 class StarFill(AbstractProcessStep):
   inputs = {"input_mask": np.ndarray}
   deliverables = {"output_mask": np.ndarray}
+  frame_local = True
 
   def _execute(self):
     """
@@ -20,6 +22,7 @@ class StarFill(AbstractProcessStep):
     cs2 = np.cumsum(self.input_mask, axis=2)
     inner2 = cs2[:,:,-1][:,:,None] * cs2 - cs2**2
     self.output_mask = (inner1 * inner2 >= 1).astype(np.int32)
+    self.deliverable_ranges["output_mask"] = ValueRange(0, 1, binary=True)
 
 
 process_steps["StarFill"] = StarFill
\ No newline at end of file
@@ -1,15 +1,18 @@
 import numpy as np
 
 from image_processing_pipeline.framework.process_step import AbstractProcessStep, process_steps
+from image_processing_pipeline.framework.value_range import ValueRange
 
 class ThresholdBinarise(AbstractProcessStep):
   inputs = {"input_stack": np.ndarray,}
   deliverables = {"binary_stack": np.ndarray,}
+  frame_local = True
+  elementwise = True
 
   options = {"threshold": (float, 0.5),}
 
   def _on_set_inputs(self):
-    assert np.all((self.input_stack >= 0) & (self.input_stack <= 1)), "Input stack must be in [0, 1] range."
+    assert self._values_within("input_stack", 0, 1), "Input stack must be in [0, 1] range."
 
   def _on_set_options(self):
     assert 0 <= self.threshold <= 1, "Threshold must be in [0, 1] range."
@@ -21,6 +24,7 @@ class ThresholdBinarise(AbstractProcessStep):
     Assume input is normalised to [0,1]. For this every pixel value below the threshold
     is set to 0, every pixel value above or equal to the threshold is set to 1.
     """
-    self.binary_stack = self.input_stack > self.threshold
+    self.binary_stack = np.greater(self.input_stack, self.threshold, out=self._empty(self.input_stack.shape, bool))
+    self.deliverable_ranges["binary_stack"] = ValueRange(0, 1, binary=True)
 
 process_steps["ThresholdBinarise"] = ThresholdBinarise
\ No newline at end of file